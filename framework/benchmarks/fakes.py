@@ -0,0 +1,86 @@
+# benchmarks/fakes.py
+"""In-memory stand-in for the agent_metadata table.
+
+Lets benchmarks/integrity_sync.py run without a Cassandra node. It answers
+exactly the statements IntegrityManager issues, including execute_async for
+the driver's execute_concurrent_with_args, and counts statements so runs can
+be compared. It says nothing about network or compaction cost; pass
+--cassandra to benchmark against a real cluster.
+"""
+import re
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+class FakeResult(list):
+    def one(self):
+        return self[0] if self else None
+
+class _FakeFuture:
+    # Callbacks run on one worker thread, as they would on the driver's event
+    # loop; running them inline would recurse once per statement
+    _callbacks = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fake-cassandra")
+
+    def __init__(self, result=None, error=None):
+        self._result = result
+        self._error = error
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def add_callbacks(self, callback, errback, callback_args=(), errback_args=(), **kwargs):
+        if self._error is not None:
+            self._callbacks.submit(errback, self._error, *errback_args)
+        else:
+            self._callbacks.submit(callback, self._result, *callback_args)
+
+class InMemoryMetadataSession:
+    """agent_metadata as {(agent_id, type): {key: value}}, like its clustering layout"""
+
+    def __init__(self):
+        self.partitions = {}
+        self.statements = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, query: str):
+        return SimpleNamespace(query_string=" ".join(query.split()), consistency_level=None)
+
+    def execute(self, statement, parameters=(), **kwargs):
+        query = statement if isinstance(statement, str) else statement.query_string
+        with self._lock:
+            self.statements += 1
+            return self._run(" ".join(query.split()), tuple(parameters or ()))
+
+    def execute_async(self, statement, parameters=(), **kwargs):
+        try:
+            return _FakeFuture(self.execute(statement, parameters))
+        except Exception as e:
+            return _FakeFuture(error=e)
+
+    def _run(self, query: str, params: tuple):
+        if query.startswith("INSERT"):
+            agent_id, kind, key, _, value = params
+            self.partitions.setdefault((agent_id, kind), {})[key] = value
+            return FakeResult()
+        kind = re.search(r"type = '(\w+)'", query)
+        kind = kind.group(1) if kind else params[1]
+        rows = self.partitions.get((params[0], kind), {})
+        if query.startswith("DELETE"):
+            if "key" in query:
+                rows.pop(params[2], None)
+            else:
+                rows.clear()
+            return FakeResult()
+        if query.startswith("SELECT"):
+            if "last_updated" in query:
+                return FakeResult()
+            if "key IN" in query:
+                keys = [key for key in params[1] if key in rows]
+            elif "key >=" in query:
+                keys = sorted(key for key in rows if params[1] <= key < params[2])
+            else:
+                keys = sorted(rows)
+            return FakeResult(SimpleNamespace(key=key, value=rows[key]) for key in keys)
+        raise NotImplementedError(f"InMemoryMetadataSession cannot run: {query}")
@@ -0,0 +1,110 @@
+# benchmarks/integrity_sync.py
+"""Benchmark IntegrityManager sync and check at 100, 10k and 100k files.
+
+For each size it times a first full sync, a sync with nothing changed, a
+sync after touching 1% of files (plus a few added and removed), and a clean
+check. It reports the rows written and deleted, which now grow with the size
+of the change rather than the size of the project.
+
+    python benchmarks/integrity_sync.py                 # in-memory agent_metadata
+    python benchmarks/integrity_sync.py --cassandra     # CASSANDRA_* from .env
+    python benchmarks/integrity_sync.py --sizes 100 10000
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from utils.sync import IntegrityManager  # noqa: E402
+from fakes import InMemoryMetadataSession  # noqa: E402
+
+def build_project(root: Path, files: int, size: int) -> list:
+    rel_paths = []
+    past = time.time() - 3600
+    for index in range(files):
+        rel_path = f"pkg{index // 2500}/mod{index // 50}/file{index}.py"
+        full_path = root / rel_path
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        full_path.write_bytes(os.urandom(size))
+        os.utime(full_path, (past, past))
+        rel_paths.append(rel_path)
+    return rel_paths
+
+def change_project(root: Path, rel_paths: list, size: int):
+    """Modify 1% of the files, add 10 and remove 10, all backdated past the cache's racy window"""
+    past = time.time() - 60
+    for rel_path in random.sample(rel_paths, max(1, len(rel_paths) // 100)):
+        (root / rel_path).write_bytes(os.urandom(size))
+        os.utime(root / rel_path, (past, past))
+    for index in range(10):
+        added = root / f"added/file{index}.py"
+        added.parent.mkdir(parents=True, exist_ok=True)
+        added.write_bytes(os.urandom(size))
+        os.utime(added, (past, past))
+    for rel_path in random.sample(rel_paths, min(10, len(rel_paths))):
+        (root / rel_path).unlink(missing_ok=True)
+
+def report(files: int, run: str, seconds: float, diff: dict = None, extra: str = ""):
+    written = len(diff["new"]) + len(diff["modified"]) + len(diff["changed_dirs"]) if diff else 0
+    deleted = len(diff["missing"]) + len(diff["removed_dirs"]) if diff else 0
+    print(f"{files:>7} | {run:>12} | {seconds * 1000:>10.1f} ms | {written:>8} | {deleted:>8} | {extra}")
+
+def bench_size(files: int, args, session):
+    root = Path(tempfile.mkdtemp(prefix="rw-sync-"))
+    agent_id = str(uuid.uuid4())
+    try:
+        rel_paths = build_project(root, files, args.size)
+        im = IntegrityManager(session)
+
+        started = time.perf_counter()
+        diff = im.update_sync_status(agent_id, root)
+        report(files, "first sync", time.perf_counter() - started, diff)
+
+        started = time.perf_counter()
+        diff = im.update_sync_status(agent_id, root)
+        report(files, "no change", time.perf_counter() - started, diff)
+
+        change_project(root, rel_paths, args.size)
+        started = time.perf_counter()
+        diff = im.update_sync_status(agent_id, root)
+        report(files, "1% changed", time.perf_counter() - started, diff)
+
+        started = time.perf_counter()
+        status = im.check_sync_status(agent_id, root)
+        report(files, "clean check", time.perf_counter() - started,
+               extra=f"{len(status['discrepancies'])} discrepancies")
+    finally:
+        for kind in ("structure", "merkle", "sync"):
+            session.execute("DELETE FROM agent_metadata WHERE agent_id = %s AND type = %s",
+                            (uuid.UUID(agent_id), kind))
+        shutil.rmtree(root, ignore_errors=True)
+
+def main(args):
+    if args.cassandra:
+        from utils.cassandra_manager import CassandraManager
+        manager = CassandraManager()
+        session = manager.session
+    else:
+        manager, session = None, InMemoryMetadataSession()
+
+    print(f"{'files':>7} | {'run':>12} | {'elapsed':>13} | {'written':>8} | {'deleted':>8} |")
+    try:
+        for files in args.sizes:
+            bench_size(files, args, session)
+    finally:
+        if manager:
+            manager.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--size", type=int, default=1024, help="Bytes per file")
+    parser.add_argument("--cassandra", action="store_true", help="Use the cluster configured in .env")
+    main(parser.parse_args())
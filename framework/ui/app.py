@@ -3,6 +3,8 @@ from dash import html, dcc, Input, Output, State, ctx
 import dash_bootstrap_components as dbc
 import dash_monaco_editor
 import requests
+from requests.adapters import HTTPAdapter
+from http.cookiejar import DefaultCookiePolicy
 import uuid
 from flask import Flask, session
 import os
@@ -23,6 +25,17 @@ app = dash.Dash(
     suppress_callback_exceptions=True
 )
 
+# --------- HTTP CONNECTION POOL ---------
+# One keep-alive Session for all API calls, so TLS handshakes happen once per
+# pooled connection instead of once per auth or prompt request. It is shared by
+# every Dash user, so it must never keep cookies one user's response sets
+api_session = requests.Session()
+api_session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+api_session.mount("https://", HTTPAdapter(
+    pool_connections=int(os.environ.get('UI_HTTP_POOL_HOSTS', '4')),
+    pool_maxsize=int(os.environ.get('UI_HTTP_POOL_SIZE', '16'))
+))
+
 def initialize_session():
     defaults = {
         'authenticated': False,
@@ -38,7 +51,7 @@ def initialize_session():
 def handle_authentication(action, email, password):
     endpoint = "/rw/login" if action == "login" else "/rw/register"
     try:
-        resp = requests.post(
+        resp = api_session.post(
             f"https://www.wolfx0.com{endpoint}",
             headers={"Content-Type": "application/json", "Origin": "vscode-webview://"},
             json={"email": email, "password": password}
@@ -100,7 +113,7 @@ def save_file_content(file_path, content):
 
 def handle_prompt_submission(prompt):
     try:
-        resp = requests.post(
+        resp = api_session.post(
             "https://wolfx0.com/rw/prompt",
             headers={
                 "Content-Type": "application/json",
@@ -0,0 +1,119 @@
+# utils/hashcache.py
+import os
+import time
+import sqlite3
+import logging
+from pathlib import Path
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = ".rwagent"
+CACHE_FILE = "hashcache"
+# Files modified this close to the scan may change again within the same
+# mtime tick, so their digests are not trusted for the next run (git's
+# "racily clean" problem); 2s covers the coarsest common timestamp (FAT)
+RACY_WINDOW_NS = 2_000_000_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (path, algorithm)
+)
+"""
+
+def stat_key(st: os.stat_result) -> tuple:
+    """The stat fields that must all match for a cached digest to be reused"""
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+class HashCache:
+    """Persistent path -> digest cache validated by size, mtime_ns and inode.
+
+    Lives in `<project>/.rwagent/hashcache` (SQLite in WAL mode), so
+    concurrent `rwagent integrity` runs can read while another writes; a
+    writer that finds the database locked waits up to `timeout` seconds.
+    If the cache cannot be opened (read-only checkout, corrupt file) every
+    lookup misses and the caller simply hashes everything.
+    """
+
+    def __init__(self, base_path: Path, timeout: float = 30.0):
+        self.path = Path(base_path) / CACHE_DIR / CACHE_FILE
+        self._db = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), timeout=timeout, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(SCHEMA)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Hash cache disabled ({self.path}): {str(e)}")
+            self.close()
+
+    @property
+    def enabled(self) -> bool:
+        return self._db is not None
+
+    def load(self, algorithm: str) -> dict:
+        """All cached entries for one algorithm: {path: (size, mtime_ns, inode, digest)}"""
+        if not self.enabled:
+            return {}
+        try:
+            rows = self._db.execute(
+                "SELECT path, size, mtime_ns, inode, digest FROM file_hashes WHERE algorithm = ?",
+                (algorithm,)
+            )
+            return {path: (size, mtime_ns, inode, digest) for path, size, mtime_ns, inode, digest in rows}
+        except sqlite3.Error as e:
+            logger.warning(f"Hash cache read failed: {str(e)}")
+            return {}
+
+    def store(self, algorithm: str, entries: list, started_ns: int = None):
+        """Save [(path, stat_result, digest)], skipping files too recently modified to trust"""
+        if not self.enabled or not entries:
+            return
+        cutoff = (started_ns or time.time_ns()) - RACY_WINDOW_NS
+        rows = [
+            (path, algorithm, st.st_size, st.st_mtime_ns, st.st_ino, digest)
+            for path, st, digest in entries if st.st_mtime_ns < cutoff
+        ]
+        try:
+            with self._transaction():
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO file_hashes (path, algorithm, size, mtime_ns, inode, digest) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Hash cache write failed: {str(e)}")
+
+    def prune(self, algorithm: str, keep: set):
+        """Drop entries for paths no longer present"""
+        if not self.enabled:
+            return
+        try:
+            stale = [(path, algorithm) for path in self.load(algorithm) if path not in keep]
+            if stale:
+                with self._transaction():
+                    self._db.executemany("DELETE FROM file_hashes WHERE path = ? AND algorithm = ?", stale)
+        except sqlite3.Error as e:
+            logger.warning(f"Hash cache prune failed: {str(e)}")
+
+    @contextmanager
+    def _transaction(self):
+        self._db.execute("BEGIN IMMEDIATE")  # Take the write lock up front, waiting on other writers
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,94 @@
+# utils/hashing.py
+import os
+import mmap
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import xxhash  # Optional: fastest non-cryptographic digest
+except ImportError:
+    xxhash = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ALGORITHM = "sha256"
+# Untagged digests predate algorithm tags and are always SHA-256
+LEGACY_ALGORITHM = "sha256"
+
+READ_BUFFER = 1 << 20       # 1 MiB reads instead of 4 KB
+MMAP_THRESHOLD = 8 << 20    # Map files this large instead of copying them through a buffer
+PARALLEL_MIN_FILES = 8      # Fewer files than this are hashed inline
+
+def _blake2b():
+    return hashlib.blake2b(digest_size=32)
+
+ALGORITHMS = {
+    "sha256": hashlib.sha256,
+    "blake2b": _blake2b,
+}
+if xxhash is not None:
+    ALGORITHMS["xxh3_128"] = xxhash.xxh3_128
+
+def tag_digest(algorithm: str, hexdigest: str) -> str:
+    return f"{algorithm}:{hexdigest}"
+
+def split_digest(digest: str) -> tuple:
+    """(algorithm, hexdigest) for a tagged or legacy untagged digest"""
+    algorithm, sep, hexdigest = digest.partition(":")
+    return (algorithm, hexdigest) if sep else (LEGACY_ALGORITHM, digest)
+
+def same_digest(a: str, b: str) -> bool:
+    """Compare digests whether or not they carry a tag"""
+    return a is not None and b is not None and split_digest(a) == split_digest(b)
+
+class HashEngine:
+    """Hashes files on a thread pool with large reads (mmap for big files).
+
+    hashlib and xxhash release the GIL while digesting large buffers, so
+    threads scale with cores; file reads overlap with hashing as well.
+    Digests are tagged with the algorithm ("blake2b:<hex>") so values from
+    different algorithms are never compared as equal.
+    """
+
+    def __init__(self, algorithm: str = None, workers: int = None):
+        self.algorithm = algorithm or os.getenv("RWAGENT_HASH_ALGORITHM", DEFAULT_ALGORITHM)
+        if self.algorithm not in ALGORITHMS:
+            raise ValueError(
+                f"Unknown hash algorithm '{self.algorithm}', choose from: {', '.join(sorted(ALGORITHMS))}"
+                + ("" if xxhash else " (install xxhash for xxh3_128)")
+            )
+        self._new = ALGORITHMS[self.algorithm]
+        self.workers = workers or int(os.getenv("RWAGENT_HASH_WORKERS", min(32, (os.cpu_count() or 1) * 2)))
+
+    def hash_file(self, file_path) -> str:
+        digest = self._new()
+        with open(file_path, "rb", buffering=0) as f:
+            size = os.fstat(f.fileno()).st_size
+            if size >= MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    digest.update(mapped)
+            else:
+                buffer = bytearray(min(READ_BUFFER, max(size, 1)))
+                view = memoryview(buffer)
+                while True:
+                    read = f.readinto(buffer)
+                    if not read:
+                        break
+                    digest.update(view[:read])
+        return tag_digest(self.algorithm, digest.hexdigest())
+
+    def _hash_if_readable(self, file_path):
+        try:
+            return self.hash_file(file_path)
+        except OSError as e:
+            # Deleted or made unreadable since the scan; one file must not abort the rest
+            logger.debug(f"Not hashing {file_path}: {e}")
+            return None
+
+    def hash_many(self, file_paths: list) -> list:
+        """Digests in the same order as file_paths, None for files that could not be read"""
+        if self.workers <= 1 or len(file_paths) < PARALLEL_MIN_FILES:
+            return [self._hash_if_readable(path) for path in file_paths]
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rwagent-hash") as pool:
+            return list(pool.map(self._hash_if_readable, file_paths))
@@ -1,86 +1,168 @@
-import hashlib
+import os
+import stat
+import time
+import logging
 from pathlib import Path
 from datetime import datetime
 from cassandra.cluster import Cluster
 from cassandra.auth import PlainTextAuthProvider
-from cassandra.query import BatchStatement, ConsistencyLevel
+from cassandra.query import ConsistencyLevel
+from cassandra.concurrent import execute_concurrent_with_args
 import uuid
-REQUIRED_FILES = {
-    "root": [
-        "README.md",
-        "requirements.txt",
-        "setup.py",
-        ".env",
-        "bin/register_agent.py",
-        "bin/query_agent_info.py"
-    ],
-    "src": [
-        "src/__init__.py",
-        "src/app.py",
-        "src/templates/docker/Dockerfile.j2"
-    ],
-    "agents": [
-        "src/agents/agent_core/__init__.py",
-        "src/agents/agent_core/core.py",
-        "src/agents/agent_ai/__init__.py",
-        "src/agents/agent_ai/core.py", 
-        "src/agents/agent_storage/__init__.py",
-        "src/agents/agent_storage/core.py"
-    ],
-    "utils": [
-        "src/utils/__init__.py",
-        "src/utils/cassandra_manager.py",
-        "src/utils/elasticsearch_manager.py"
-    ]
-}
+from utils.hashcache import HashCache, stat_key
+from utils.hashing import HashEngine, split_digest, tag_digest
+from utils.tree_scanner import ROOT, DirNode, MemoryTree, scan_tree, build_merkle, diff_trees
+
+logger = logging.getLogger(__name__)
+
+class MerkleRows:
+    """Registered directory nodes (type 'merkle'), fetched from agent_metadata on demand.
+
+    `key` is the directory path and a clustering column, so a whole subtree
+    is one range query: [dir, dir + "0") covers "dir" and "dir/..." because
+    "0" sorts right after "/".
+    """
+
+    def __init__(self, session, agent_id: str):
+        self.session = session
+        self.agent_id = uuid.UUID(agent_id)
+        self.queries = 0
+        self._nodes = {}
+
+    def root(self):
+        return self.load([ROOT]).get(ROOT)
+
+    def load(self, directories: list) -> dict:
+        missing = [d for d in directories if d not in self._nodes]
+        if missing:
+            self.queries += 1
+            rows = self.session.execute(
+                "SELECT key, value FROM agent_metadata WHERE agent_id = %s AND type = 'merkle' AND key IN %s",
+                (self.agent_id, tuple(missing))
+            )
+            self._nodes.update((row.key, DirNode.from_json(row.value)) for row in rows)
+        return {d: self._nodes[d] for d in directories if d in self._nodes}
+
+    def load_subtree(self, directory: str) -> dict:
+        self.queries += 1
+        rows = self.session.execute(
+            "SELECT key, value FROM agent_metadata WHERE agent_id = %s AND type = 'merkle' "
+            "AND key >= %s AND key < %s",
+            (self.agent_id, directory, directory + "0")
+        )
+        prefix = directory + "/"
+        nodes = {row.key: DirNode.from_json(row.value) for row in rows
+                 if row.key == directory or row.key.startswith(prefix)}
+        self._nodes.update(nodes)
+        return nodes
+
 class IntegrityManager:
-    def __init__(self, session):
+    def __init__(self, session, use_cache: bool = True, algorithm: str = None, workers: int = None):
         self.session = session
-        print("DEBUG: IntegrityManager initialized")
+        # Digests are reused while a file's size, mtime and inode are unchanged
+        self.use_cache = use_cache and os.getenv("RWAGENT_HASH_CACHE", "true").lower() == "true"
+        # RWAGENT_HASH_ALGORITHM=blake2b (or xxh3_128 with xxhash installed) for faster syncs
+        self.engine = HashEngine(algorithm, workers)
+        # Sync writes are individual prepared statements with this many in flight
+        self.write_concurrency = int(os.getenv("RWAGENT_SYNC_CONCURRENCY", "64"))
+        logger.debug("IntegrityManager initialized")
 
     def generate_file_hash(self, file_path: Path) -> str:
-        hash_sha256 = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_sha256.update(chunk)
-        return hash_sha256.hexdigest()
+        return self.engine.hash_file(file_path)
 
     def check_sync_status(self, agent_id: str, base_path: Path) -> dict:
-        print(f"DEBUG: check_sync_status({agent_id})")
-        current_hashes = self._get_current_hashes(base_path)
+        logger.debug(f"check_sync_status({agent_id})")
+        registered = MerkleRows(self.session, agent_id)
+        root = registered.root()
+        if root is None:
+            # Synced before directory hashes were stored: compare every registered path
+            return self._check_all_paths(agent_id, base_path)
+
+        # Hash with whatever algorithm the last sync used, so the digests are comparable
+        algorithm = split_digest(root.hash)[0]
+        current_hashes = self._get_current_hashes(base_path, algorithm)
+        # Equal root hashes end the check; otherwise only differing subtrees are fetched
+        diff = diff_trees(build_merkle(current_hashes, algorithm), registered)
+        logger.debug(f"fetched {registered.queries} merkle queries")
+        return self._sync_report(agent_id, diff, len(current_hashes))
+
+    def _check_all_paths(self, agent_id: str, base_path: Path) -> dict:
         registered = self.session.execute(
             "SELECT key, value FROM agent_metadata WHERE agent_id = %s AND type = 'structure'",
             [uuid.UUID(agent_id)]
         )
         registered_hashes = {row.key: row.value for row in registered}
-        discrepancies = []
-        for path, curr_hash in current_hashes.items():
-            reg_hash = registered_hashes.get(path)
-            if not reg_hash:
-                discrepancies.append(f"New file: {path}")
-            elif reg_hash != curr_hash:
-                discrepancies.append(f"Modified: {path}")
-        for reg_path in registered_hashes:
-            if reg_path not in current_hashes:
-                discrepancies.append(f"Missing: {reg_path}")
+        algorithm = next((split_digest(v)[0] for v in registered_hashes.values()), self.engine.algorithm)
+        current_hashes = self._get_current_hashes(base_path, algorithm)
+        # Both sides as Merkle trees: identical subtrees are skipped without comparing their files
+        diff = diff_trees(build_merkle(current_hashes, algorithm), MemoryTree(build_merkle(registered_hashes, algorithm)))
+        return self._sync_report(agent_id, diff, len(current_hashes))
+
+    def _sync_report(self, agent_id: str, diff: dict, total_files: int) -> dict:
+        discrepancies = (
+            [f"New file: {path}" for path in diff["new"]]
+            + [f"Modified: {path}" for path in diff["modified"]]
+            + [f"Missing: {path}" for path in diff["missing"]]
+        )
         return {
             "is_valid": len(discrepancies) == 0,
             "last_sync": self.get_last_sync(agent_id),
             "discrepancies": discrepancies,
-            "total_files": len(current_hashes)
+            "total_files": total_files
         }
 
-    def _get_current_hashes(self, base_path: Path) -> dict:
-        print("DEBUG: _get_current_hashes()")
-        hashes = {}
-        
-        # Process all files from REQUIRED_FILES
-        for category in REQUIRED_FILES.values():
-            for file_path in category:
-                full_path = base_path / file_path
-                if full_path.exists():
-                    rel_path = str(full_path.relative_to(base_path))
-                    hashes[rel_path] = self.generate_file_hash(full_path)
+    def _get_current_hashes(self, base_path: Path, algorithm: str = None) -> dict:
+        logger.debug("_get_current_hashes()")
+        # Every file in the project except those excluded by .gitignore/.rwagentignore
+        stats = scan_tree(base_path)
+        return self.hash_files(base_path, stats.keys(), algorithm, stats)
+
+    def hash_files(self, base_path: Path, rel_paths, algorithm: str = None, stats: dict = None) -> dict:
+        """Hash the existing files among rel_paths, re-reading only those whose stat changed
+
+        `stats` ({path: stat_result} from scan_tree) saves a stat call per file
+        and marks a whole-tree scan, after which cache entries for paths no
+        longer present are pruned.
+        """
+        engine = self.engine if algorithm in (None, self.engine.algorithm) else HashEngine(algorithm, self.engine.workers)
+        started_ns = time.time_ns()
+        cache = HashCache(base_path) if self.use_cache else None
+        cached = cache.load(engine.algorithm) if cache else {}
+        hashes, stale = {}, []
+        try:
+            root = str(base_path)
+            for rel_path in rel_paths:
+                # os.path rather than pathlib: this loop runs once per file on every check
+                if stats is not None:
+                    st = stats[rel_path]
+                else:
+                    rel_path = os.path.normpath(rel_path)
+                    try:
+                        st = os.stat(os.path.join(root, rel_path))
+                    except OSError:
+                        continue  # Missing files are reported by the caller
+                    if not stat.S_ISREG(st.st_mode):
+                        continue
+                entry = cached.get(rel_path)
+                if entry is not None and entry[:3] == stat_key(st):
+                    hashes[rel_path] = tag_digest(*split_digest(entry[3]))
+                    continue
+                stale.append((rel_path, os.path.join(root, rel_path), st))
+
+            # Changed files are hashed together so the engine can spread them over its pool
+            digests = engine.hash_many([full_path for _, full_path, _ in stale])
+            # A file that vanished or became unreadable since the scan is left out, i.e. reported missing
+            fresh = [(rel_path, st, digest) for (rel_path, _, st), digest in zip(stale, digests)
+                     if digest is not None]
+            hashes.update((rel_path, digest) for rel_path, _, digest in fresh)
+            if cache:
+                logger.debug(f"hashed {len(fresh)} of {len(hashes)} files, rest from cache")
+                cache.store(engine.algorithm, fresh, started_ns)
+                if stats is not None and len(cached) > len(hashes) - len(fresh):
+                    cache.prune(engine.algorithm, hashes.keys())
+        finally:
+            if cache:
+                cache.close()
         return hashes
 
     def get_last_sync(self, agent_id: str) -> datetime:
@@ -91,41 +173,59 @@ class IntegrityManager:
         return result.last_updated if result else None
 
     def update_sync_status(self, agent_id: str, base_path: Path):
-        print(f"DEBUG: update_sync_status({agent_id})")
+        logger.debug(f"update_sync_status({agent_id})")
+        agent_uuid = uuid.UUID(agent_id)
         current_hashes = self._get_current_hashes(base_path)
+        tree = build_merkle(current_hashes, self.engine.algorithm)
         timestamp = datetime.now()
 
         try:
-            print("DEBUG: Clearing existing records")
-            self.session.execute(
-                "DELETE FROM agent_metadata WHERE agent_id = %s AND type = 'structure'",
-                (uuid.UUID(agent_id),)
-            )
+            logger.debug("Computing delta against registered state")
+            registered = MerkleRows(self.session, agent_id)
+            if registered.root() is not None:
+                diff = diff_trees(tree, registered)
+            else:
+                # No directory rows yet: diff files against the structure rows, write every directory
+                rows = self.session.execute(
+                    "SELECT key, value FROM agent_metadata WHERE agent_id = %s AND type = 'structure'",
+                    [agent_uuid]
+                )
+                registered_tree = build_merkle({row.key: row.value for row in rows}, self.engine.algorithm)
+                diff = diff_trees(tree, MemoryTree(registered_tree))
+                diff["changed_dirs"], diff["removed_dirs"] = list(tree), []
 
-            print("DEBUG: Preparing batch insert")
-            insert_query = """
+            insert = self.session.prepare("""
                 INSERT INTO agent_metadata 
                 (agent_id, type, key, last_updated, value)
                 VALUES (?, ?, ?, ?, ?)
-            """
-            prepared = self.session.prepare(insert_query)
-            batch = BatchStatement(consistency_level=ConsistencyLevel.QUORUM)
-
-            for path, hash_val in current_hashes.items():
-                params = (
-                    uuid.UUID(agent_id),
-                    'structure',
-                    path,
-                    timestamp,
-                    hash_val
-                )
-                print(f"DEBUG: Adding batch params: {params}")
-                batch.add(prepared, params)
+            """)
+            delete = self.session.prepare(
+                "DELETE FROM agent_metadata WHERE agent_id = ? AND type = ? AND key = ?"
+            )
+            insert.consistency_level = delete.consistency_level = ConsistencyLevel.QUORUM
 
-            print("DEBUG: Executing batch")
-            self.session.execute(batch)
+            # Deepest directories first and the root last: a sync interrupted
+            # part-way keeps the old root, so the next check still sees drift
+            changed_dirs = sorted(
+                (d for d in diff["changed_dirs"] if d != ROOT), key=lambda d: d.count("/"), reverse=True
+            )
+            upserts = [
+                (agent_uuid, 'structure', path, timestamp, current_hashes[path])
+                for path in diff["new"] + diff["modified"]
+            ] + [
+                (agent_uuid, 'merkle', directory, timestamp, tree[directory].to_json())
+                for directory in changed_dirs
+            ]
+            deletes = [(agent_uuid, 'structure', path) for path in diff["missing"]] + \
+                [(agent_uuid, 'merkle', directory) for directory in diff["removed_dirs"]]
+
+            logger.debug(f"Writing {len(upserts)} rows, deleting {len(deletes)} rows")
+            self._execute_concurrent(insert, upserts)
+            self._execute_concurrent(delete, deletes)
+            if ROOT in diff["changed_dirs"]:
+                self.session.execute(insert, (agent_uuid, 'merkle', ROOT, timestamp, tree[ROOT].to_json()))
 
-            print("DEBUG: Updating sync timestamp")
+            logger.debug("Updating sync timestamp")
             self.session.execute(
                 """
                 INSERT INTO agent_metadata 
@@ -133,15 +233,26 @@ class IntegrityManager:
                 VALUES (%s, %s, %s, %s, %s)
                 """,
                 (
-                    uuid.UUID(agent_id),
+                    agent_uuid,
                     'sync',
                     'last_sync',
                     timestamp,
                     'true'
                 )
             )
+            return diff
 
         except Exception as e:
-            print(f"CRITICAL ERROR: {str(e)}")
+            logger.error(f"Sync failed: {str(e)}")
             raise
 
+    def _execute_concurrent(self, statement, params: list):
+        """Run one prepared statement per parameter tuple, at most write_concurrency in flight"""
+        if not params:
+            return
+        results = execute_concurrent_with_args(
+            self.session, statement, params, concurrency=self.write_concurrency, raise_on_first_error=False
+        )
+        failures = [result for success, result in results if not success]
+        if failures:
+            raise RuntimeError(f"{len(failures)} of {len(params)} writes failed, first: {failures[0]}")
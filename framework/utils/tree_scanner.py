@@ -0,0 +1,243 @@
+# utils/tree_scanner.py
+import os
+import re
+import json
+from utils.hashing import ALGORITHMS, split_digest, tag_digest
+
+IGNORE_FILES = (".gitignore", ".rwagentignore")
+# Never tracked: VCS metadata and rwagent's own local state (hash cache)
+ALWAYS_IGNORED = {".git", ".rwagent"}
+ROOT = "."
+
+class IgnoreRule:
+    """One .gitignore-style pattern, matched against paths relative to its file's directory"""
+
+    def __init__(self, pattern: str):
+        self.negate = pattern.startswith("!")
+        if self.negate:
+            pattern = pattern[1:]
+        elif pattern.startswith("\\"):
+            pattern = pattern[1:]  # Escaped leading '#' or '!'
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        # A slash anywhere but the end anchors the pattern to the ignore file's directory
+        anchored = "/" in pattern
+        body = _glob_to_regex(pattern.lstrip("/"))
+        self.regex = re.compile(("^" if anchored else "^(?:.*/)?") + body + "$")
+
+    def matches(self, rel_path: str, is_dir: bool) -> bool:
+        return (is_dir or not self.dir_only) and self.regex.match(rel_path) is not None
+
+def _glob_to_regex(pattern: str) -> str:
+    out, i = [], 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            chars = pattern[i + 1:end]
+            out.append("[" + ("^" + chars[1:] if chars.startswith("!") else chars).replace("\\", "\\\\") + "]")
+            i = end + 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+def load_ignore_rules(directory: str) -> list:
+    """Patterns from the ignore files directly in `directory`, in file order"""
+    rules = []
+    for name in IGNORE_FILES:
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8", errors="replace") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            continue
+        for line in lines:
+            line = line.rstrip()
+            if line and not line.startswith("#"):
+                rules.append(IgnoreRule(line))
+    return rules
+
+def _is_ignored(rule_stack: list, rel_path: str, is_dir: bool) -> bool:
+    """Last matching rule wins; rules from deeper ignore files are checked last"""
+    ignored = False
+    for base, rules in rule_stack:
+        sub_path = rel_path[len(base) + 1:] if base else rel_path
+        for rule in rules:
+            if rule.matches(sub_path, is_dir):
+                ignored = not rule.negate
+    return ignored
+
+def scan_tree(base_path) -> dict:
+    """{relative path: stat_result} for every tracked regular file under base_path.
+
+    Walks with os.scandir, whose entries carry the file type, so only files
+    cost a stat call. Ignored directories are pruned before they are opened,
+    and as in git a file inside an ignored directory cannot be re-included.
+    """
+    root = str(base_path)
+    files = {}
+    pending = [("", [])]  # (relative dir, rule stack of its ancestors)
+    while pending:
+        rel_dir, parent_stack = pending.pop()
+        directory = os.path.join(root, rel_dir) if rel_dir else root
+        rules = load_ignore_rules(directory)
+        rule_stack = parent_stack + [(rel_dir, rules)] if rules else parent_stack
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name in ALWAYS_IGNORED:
+                continue
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not _is_ignored(rule_stack, rel_path, True):
+                        pending.append((rel_path, rule_stack))
+                elif entry.is_file() and not _is_ignored(rule_stack, rel_path, False):
+                    files[rel_path] = entry.stat()
+            except OSError:
+                continue  # Vanished or unreadable mid-scan
+    return files
+
+class DirNode:
+    """A directory in the Merkle tree: its hash and the digests of its direct children"""
+
+    __slots__ = ("hash", "files", "dirs")
+
+    def __init__(self, hash: str = None, files: dict = None, dirs: dict = None):
+        self.hash = hash
+        self.files = files or {}   # name -> file digest
+        self.dirs = dirs or {}     # name -> subdirectory hash
+
+    def to_json(self) -> str:
+        return json.dumps({"hash": self.hash, "files": self.files, "dirs": self.dirs}, sort_keys=True,
+                          separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, value: str):
+        data = json.loads(value)
+        return cls(data["hash"], data["files"], data["dirs"])
+
+def child_path(directory: str, name: str) -> str:
+    return name if directory == ROOT else f"{directory}/{name}"
+
+def parent_dir(rel_path: str) -> str:
+    head, _, _ = rel_path.rpartition("/")
+    return head or ROOT
+
+def build_merkle(hashes: dict, algorithm: str) -> dict:
+    """{directory: DirNode} for the files in `hashes`, keyed "." for the root.
+
+    A directory's hash covers the sorted names and digests of its files and
+    the hashes of its subdirectories, so equal hashes mean identical subtrees.
+    """
+    nodes = {ROOT: DirNode()}
+    for rel_path, digest in hashes.items():
+        directory = parent_dir(rel_path)
+        nodes.setdefault(directory, DirNode()).files[rel_path.rpartition("/")[2]] = \
+            tag_digest(*split_digest(digest))
+        # Register the directory chain up to the first ancestor already linked
+        while directory != ROOT:
+            parent = parent_dir(directory)
+            siblings = nodes.setdefault(parent, DirNode()).dirs
+            name = directory.rpartition("/")[2]
+            if name in siblings:
+                break
+            siblings[name] = None  # Filled in once the subdirectory is hashed
+            directory = parent
+
+    new_digest = ALGORITHMS[algorithm]
+    # Deepest directories first, so children are hashed before their parents
+    for directory in sorted(nodes, key=lambda d: -1 if d == ROOT else d.count("/"), reverse=True):
+        node = nodes[directory]
+        for name in node.dirs:
+            node.dirs[name] = nodes[child_path(directory, name)].hash
+        digest = new_digest()
+        for name in sorted(node.files):
+            digest.update(f"f {name} {node.files[name]}\n".encode())
+        for name in sorted(node.dirs):
+            digest.update(f"d {name} {node.dirs[name]}\n".encode())
+        node.hash = tag_digest(algorithm, digest.hexdigest())
+    return nodes
+
+class MemoryTree:
+    """Registered tree held in memory; the interface diff_trees loads nodes through"""
+
+    def __init__(self, nodes: dict):
+        self._nodes = nodes
+
+    def load(self, directories: list) -> dict:
+        """{directory: DirNode} for the requested directories that exist"""
+        return {d: self._nodes[d] for d in directories if d in self._nodes}
+
+    def load_subtree(self, directory: str) -> dict:
+        """{directory: DirNode} for `directory` and everything below it"""
+        prefix = directory + "/"
+        return {d: node for d, node in self._nodes.items() if d == directory or d.startswith(prefix)}
+
+def _subtree_files(directory: str, nodes: dict, dirs: list) -> list:
+    """File paths under `directory`; its directories are appended to `dirs`"""
+    node = nodes.get(directory)
+    if node is None:
+        return []
+    dirs.append(directory)
+    paths = [child_path(directory, name) for name in node.files]
+    for name in node.dirs:
+        paths.extend(_subtree_files(child_path(directory, name), nodes, dirs))
+    return paths
+
+def diff_trees(current: dict, registered) -> dict:
+    """Compare the current Merkle tree with the registered one, skipping equal subtrees.
+
+    `registered` loads registered nodes (see MemoryTree). Only directories
+    whose hash differs are loaded, the differing children of a directory in
+    one call; a directory that no longer exists is loaded as a whole subtree.
+    Returns {"new": [...], "modified": [...], "missing": [...]} of file paths,
+    plus "changed_dirs" (current directories whose node differs or is new)
+    and "removed_dirs" (registered directories that no longer exist).
+    """
+    result = {"new": [], "modified": [], "missing": [], "changed_dirs": [], "removed_dirs": []}
+
+    def walk(directory: str, current_node: DirNode, registered_node: DirNode):
+        result["changed_dirs"].append(directory)
+        for name in sorted(current_node.files.keys() | registered_node.files.keys()):
+            path = child_path(directory, name)
+            if name not in registered_node.files:
+                result["new"].append(path)
+            elif name not in current_node.files:
+                result["missing"].append(path)
+            elif current_node.files[name] != registered_node.files[name]:
+                result["modified"].append(path)
+
+        changed = []
+        for name in sorted(current_node.dirs.keys() | registered_node.dirs.keys()):
+            path = child_path(directory, name)
+            if current_node.dirs.get(name) == registered_node.dirs.get(name):
+                continue  # Identical subtree
+            if name not in registered_node.dirs:
+                result["new"].extend(_subtree_files(path, current, result["changed_dirs"]))
+            elif name not in current_node.dirs:
+                result["missing"].extend(_subtree_files(path, registered.load_subtree(path), result["removed_dirs"]))
+            else:
+                changed.append(path)
+        registered_children = registered.load(changed) if changed else {}
+        for path in changed:
+            walk(path, current[path], registered_children.get(path) or DirNode())
+
+    current_root = current.get(ROOT) or DirNode()
+    registered_root = registered.load([ROOT]).get(ROOT) or DirNode()
+    if current_root.hash != registered_root.hash:
+        walk(ROOT, current_root, registered_root)
+    return result
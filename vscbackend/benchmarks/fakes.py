@@ -0,0 +1,177 @@
+# benchmarks/fakes.py
+"""In-process stand-ins for the backend's external services.
+
+Used by benchmarks/run_suite.py to boot src/app.py without Cassandra,
+Elasticsearch or provider API keys, so the suite measures the backend itself:
+
+- FakeCassandraSession answers the prepared AuthService queries from a dict
+- InMemoryElasticsearch implements the index/search/bulk calls the chat
+  history code makes
+- fake_router() routes prompts to FakeProvider backends named anthropic and
+  groq with configurable latency, jitter and error rate
+"""
+import json
+import threading
+import itertools
+from contextlib import contextmanager
+from collections import namedtuple
+from types import SimpleNamespace
+from typing import Optional
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+FAKE_CODE = "def generated(n):\n    return n * 2"
+
+UserRow = namedtuple("UserRow", ["email", "password"])
+
+class FakeResult:
+    def __init__(self, rows: list):
+        self._rows = rows
+
+    def one(self):
+        return self._rows[0] if self._rows else None
+
+    def __iter__(self):
+        return iter(self._rows)
+
+class FakeCassandraSession:
+    """Dict-backed session understanding the users-table statements AuthService prepares"""
+
+    def __init__(self):
+        self.users = {}
+        self._lock = threading.Lock()
+
+    def prepare(self, query: str):
+        return SimpleNamespace(query_string=query)
+
+    def execute(self, statement, params=()):
+        query = getattr(statement, "query_string", statement)
+        with self._lock:
+            if query.startswith("INSERT INTO users"):
+                email, password = params[0], params[1]
+                self.users[email] = UserRow(email, password)
+                return FakeResult([])
+            if query.startswith("SELECT") and "FROM users" in query:
+                user = self.users.get(params[0])
+                return FakeResult([user] if user else [])
+        raise NotImplementedError(f"FakeCassandraSession cannot run: {query}")
+
+class _JsonSerializer:
+    def dumps(self, data) -> bytes:
+        return data.encode() if isinstance(data, str) else json.dumps(data, default=str).encode()
+
+class _FakeIndices:
+    def __init__(self, es):
+        self.es = es
+
+    def exists(self, index: str) -> bool:
+        return index in self.es.documents
+
+    def create(self, index: str, body: dict = None, **kwargs):
+        self.es.documents.setdefault(index, {})
+        return {"acknowledged": True}
+
+class _NoTracing:
+    """The client's `_otel` hook with tracing off; elasticsearch.helpers wrap every bulk call in it"""
+
+    @contextmanager
+    def helpers_span(self, span_name: str):
+        yield SimpleNamespace(otel_span=None)
+
+    @contextmanager
+    def use_span(self, span):
+        yield
+
+class InMemoryElasticsearch:
+    """Enough of the Elasticsearch client for chat history reads, writes and bulk indexing.
+
+    Matches the client surface elasticsearch.helpers.streaming_bulk touches
+    (`_otel`, `options()`, `transport.serializers`, `bulk(...).body`), so the
+    write-behind queue indexes through the real helpers.
+    """
+
+    def __init__(self):
+        self.documents = {}  # index -> {_id: source}
+        self.indices = _FakeIndices(self)
+        self.transport = SimpleNamespace(serializers=SimpleNamespace(get_serializer=lambda _: _JsonSerializer()))
+        self._otel = _NoTracing()
+        self._client_meta = ()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def options(self, **kwargs):
+        return self
+
+    def index(self, index: str, document: dict = None, body: dict = None, id: str = None, **kwargs):
+        with self._lock:
+            doc_id = id or str(next(self._ids))
+            self.documents.setdefault(index, {})[doc_id] = document if document is not None else body
+        return {"_id": doc_id, "result": "created"}
+
+    def bulk(self, operations=None, body=None, **kwargs):
+        lines = [json.loads(line) for line in (operations or body)]
+        items = []
+        for action, source in zip(lines[::2], lines[1::2]):
+            meta = action.get("index") or action.get("create") or {}
+            result = self.index(meta.get("_index"), document=source, id=meta.get("_id"))
+            items.append({"index": {"_id": result["_id"], "status": 201}})
+        return SimpleNamespace(body={"errors": False, "items": items})
+
+    @staticmethod
+    def _matches(source: dict, query: dict) -> bool:
+        if not query or "match_all" in query:
+            return True
+        if "term" in query:
+            (field, value), = query["term"].items()
+            value = value.get("value") if isinstance(value, dict) else value
+            return source.get(field.replace(".keyword", "")) == value
+        if "bool" in query:
+            return all(InMemoryElasticsearch._matches(source, q) for q in query["bool"].get("must", []))
+        raise NotImplementedError(f"InMemoryElasticsearch cannot run query: {query}")
+
+    @staticmethod
+    def _sort_keys(sort) -> list:
+        if not sort:
+            return []
+        if isinstance(sort, str):
+            return [tuple(part.split(":")) if ":" in part else (part, "asc") for part in sort.split(",")]
+        keys = []
+        for entry in sort:
+            (field, order), = entry.items() if isinstance(entry, dict) else ((entry, "asc"),)
+            keys.append((field, order.get("order", "asc") if isinstance(order, dict) else order))
+        return keys
+
+    def search(self, index: str, query: dict = None, sort=None, size: int = 10, body: dict = None, **kwargs):
+        if body:
+            query, sort, size = body.get("query", query), body.get("sort", sort), body.get("size", size)
+        with self._lock:
+            hits = [source for source in self.documents.get(index, {}).values() if self._matches(source, query)]
+        for field, order in reversed(self._sort_keys(sort)):
+            hits.sort(key=lambda source: str(source.get(field, "")) if not isinstance(source.get(field), (int, float))
+                      else source.get(field), reverse=order == "desc")
+        return {"hits": {"total": {"value": len(hits)}, "hits": [{"_source": source} for source in hits[:size]]}}
+
+    def delete_by_query(self, index: str, query: dict = None, **kwargs):
+        with self._lock:
+            documents = self.documents.get(index, {})
+            doomed = [doc_id for doc_id, source in documents.items() if self._matches(source, query)]
+            for doc_id in doomed:
+                del documents[doc_id]
+        return {"deleted": len(doomed)}
+
+class FakeChatAnthropic(FakeListChatModel):
+    """Drop-in for ChatAnthropic: accepts its constructor arguments and answers with FAKE_CODE"""
+
+    model: str = "fake-claude"
+    temperature: float = 0.0
+    max_tokens: int = 4000
+    anthropic_api_key: Optional[str] = None
+    responses: list = [FAKE_CODE]
+
+def fake_router(latency: float = 0.2, jitter: float = 0.05, error_rate: float = 0.0):
+    """LLMRouter over fake anthropic and groq backends"""
+    from services.llm_router import LLMRouter, Backend
+    from services.llm_service import FakeProvider
+    return LLMRouter([
+        Backend(FakeProvider("anthropic", latency, jitter, error_rate, FAKE_CODE), "claude-3-5-sonnet-20240620"),
+        Backend(FakeProvider("groq", latency, jitter, error_rate, FAKE_CODE), "llama3-70b-8192"),
+    ])
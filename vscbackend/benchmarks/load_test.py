@@ -0,0 +1,132 @@
+# benchmarks/load_test.py
+"""Load-test harness for the /rw API.
+
+Drives concurrent traffic at one or more running backends and prints throughput
+and latency percentiles side by side, e.g. to compare the threaded server
+(src/app.py) with the ASGI server (src/asgi_app.py). Requests shed with 503 by
+admission control are counted in `shed_rate`, not in errors, latency or
+throughput:
+
+    RW_SOCKET_PATH=/tmp/rw_threaded.sock python src/app.py &
+    RW_SOCKET_PATH=/tmp/rw_asgi.sock python src/asgi_app.py &
+    python benchmarks/load_test.py \\
+        --target threaded=unix:/tmp/rw_threaded.sock \\
+        --target asgi=unix:/tmp/rw_asgi.sock \\
+        --endpoint prompt --token "$RW_JWT" --concurrency 500 --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+import aiohttp
+
+def parse_target(spec: str) -> tuple:
+    """Split a NAME=ADDRESS target into (name, base_url, unix_socket)"""
+    name, _, address = spec.partition("=")
+    if not address:
+        name, address = spec, spec
+    if address.startswith("unix:"):
+        return name, "http://localhost", address[len("unix:"):]
+    return name, address.rstrip("/"), None
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def build_request(endpoint: str, args) -> tuple:
+    """Return (path, json_body, headers) for one request of the given kind"""
+    headers = {"Content-Type": "application/json", "Origin": "vscode-webview://"}
+    if endpoint == "register":
+        body = {"email": f"load-{uuid.uuid4().hex[:12]}@example.com", "password": args.password}
+        return "/rw/register", body, headers
+    if endpoint == "login":
+        return "/rw/login", {"email": args.email, "password": args.password}, headers
+    headers["Authorization"] = f"Bearer {args.token}"
+    return "/rw/prompt", {"prompt": args.prompt, "new_thread": True}, headers
+
+async def run_target(name: str, base_url: str, unix_socket: str, args) -> dict:
+    """Fire args.requests requests at one backend with args.concurrency in flight"""
+    connector = (
+        aiohttp.UnixConnector(path=unix_socket, limit=args.concurrency)
+        if unix_socket else aiohttp.TCPConnector(limit=args.concurrency)
+    )
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    latencies, errors, shed, statuses = [], 0, 0, {}
+    remaining = iter(range(args.requests))
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+        async def worker():
+            nonlocal errors, shed
+            for _ in remaining:
+                path, body, headers = build_request(args.endpoint, args)
+                started = time.perf_counter()
+                try:
+                    async with http.post(base_url + path, json=body, headers=headers) as resp:
+                        await resp.read()
+                        statuses[resp.status] = statuses.get(resp.status, 0) + 1
+                        if resp.status == 503:
+                            # Admission control turned it away; kept out of errors and latency
+                            shed += 1
+                            continue
+                        if resp.status >= 400:
+                            errors += 1
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    statuses["connection_error"] = statuses.get("connection_error", 0) + 1
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "target": name,
+        "endpoint": args.endpoint,
+        "concurrency": args.concurrency,
+        "requests": len(latencies) + shed,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+        "shed_rate": round(shed / (len(latencies) + shed), 4) if latencies or shed else 0.0,
+        "statuses": {str(k): v for k, v in statuses.items()}
+    }
+
+def print_report(results: list):
+    """Print a side-by-side comparison table"""
+    columns = ["target", "requests", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "error_rate", "shed_rate"]
+    print(" | ".join(f"{c:>14}" for c in columns))
+    for result in results:
+        print(" | ".join(f"{str(result[c]):>14}" for c in columns))
+
+async def main(args):
+    results = []
+    for spec in args.target:
+        name, base_url, unix_socket = parse_target(spec)
+        results.append(await run_target(name, base_url, unix_socket, args))
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the /rw API")
+    parser.add_argument("--target", action="append", required=True,
+                        help="NAME=unix:/path.sock or NAME=http://host:port (repeatable)")
+    parser.add_argument("--endpoint", choices=["register", "login", "prompt"], default="prompt")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--token", default="", help="JWT used for /rw/prompt")
+    parser.add_argument("--email", default="load@example.com")
+    parser.add_argument("--password", default="LoadTest#12345")
+    parser.add_argument("--prompt", default="Write a recursive Fibonacci function")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    asyncio.run(main(parser.parse_args()))
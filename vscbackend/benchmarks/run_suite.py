@@ -0,0 +1,185 @@
+# benchmarks/run_suite.py
+"""Benchmark suite: boots src/app.py on local fakes and load-tests it.
+
+Cassandra, Elasticsearch and the LLM providers are replaced by the stand-ins in
+benchmarks/fakes.py, a throwaway RSA key pair signs the JWTs, and the app is
+served in-process on a local port. Register, login and prompt traffic is then
+driven through benchmarks/load_test.py and the results written as JSON, tagged
+with the current commit, so runs can be compared across commits:
+
+    python benchmarks/run_suite.py --concurrency 50 --requests 500 \\
+        --llm-latency 0.3 --json bench-$(git rev-parse --short HEAD).json
+    python benchmarks/run_suite.py --compare bench-old.json bench-new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+sys.path.insert(0, BENCH_DIR)
+
+import fakes  # noqa: E402
+import load_test  # noqa: E402
+
+SCENARIOS = ("register", "login", "prompt")
+
+def write_jwt_keys(directory: str):
+    """Generate a throwaway RS256 key pair and point AuthService at it"""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_path = os.path.join(directory, "private.pem")
+    public_path = os.path.join(directory, "public.pem")
+    with open(private_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    with open(public_path, "wb") as f:
+        f.write(key.public_key().public_bytes(serialization.Encoding.PEM,
+                                              serialization.PublicFormat.SubjectPublicKeyInfo))
+    os.environ["JWT_PRIVATE_KEY_PATH"] = private_path
+    os.environ["JWT_PUBLIC_KEY_PATH"] = public_path
+
+def boot_app(args):
+    """Import src/app.py with every external service faked, returning the app module"""
+    os.environ["RESPONSE_CACHE_ENABLED"] = "true" if args.cache else "false"
+    # Queue every in-flight register/login for bcrypt rather than shedding past the default backlog
+    os.environ.setdefault("BCRYPT_MAX_PENDING", str(args.concurrency))
+    os.environ.pop("LLM_BACKENDS", None)
+
+    # Patched before the services import them by name
+    import langchain_anthropic
+    langchain_anthropic.ChatAnthropic = fakes.FakeChatAnthropic
+    import utils.database
+    import utils.http_pool
+    es = fakes.InMemoryElasticsearch()
+    utils.http_pool.shared_elasticsearch = lambda: es
+    utils.database.get_cassandra_session = lambda: fakes.FakeCassandraSession()
+
+    import app as backend
+    backend.middleware.get().provider = fakes.fake_router(args.llm_latency, args.llm_jitter, args.llm_error_rate)
+    return backend
+
+def unindexed_documents(backend) -> list:
+    """Flush every write-behind queue, describing any that still hold or dropped documents"""
+    problems = []
+    for service in (backend.middleware, backend.middleware_v2):
+        if not service.ready:
+            continue
+        writer = service.writer
+        writer.flush()
+        if writer.pending() or writer.dead_letters:
+            problems.append(f"{service.name}: {writer.pending()} chat messages not indexed, "
+                            f"{len(writer.dead_letters)} dead-lettered")
+    return problems
+
+def serve(flask_app) -> str:
+    """Run the app on a threaded local server, returning its base URL"""
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-server", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def seed_user(flask_app, args) -> str:
+    """Register the login/prompt user and return its JWT"""
+    client = flask_app.test_client()
+    body = {"email": args.email, "password": args.password}
+    resp = client.post("/rw/register", json=body)
+    if resp.status_code not in (201, 409):
+        raise RuntimeError(f"Seeding user failed: {resp.status_code} {resp.get_json()}")
+    return client.post("/rw/login", json=body).get_json()["token"]
+
+async def run_scenarios(base_url: str, args) -> list:
+    results = []
+    for scenario in args.scenario:
+        scenario_args = argparse.Namespace(**vars(args))
+        scenario_args.endpoint = scenario
+        result = await load_test.run_target("app", base_url, None, scenario_args)
+        results.append(result)
+    return results
+
+def compare(old_path: str, new_path: str):
+    """Print the change in each metric between two result files"""
+    with open(old_path) as f:
+        old = {r["endpoint"]: r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = {r["endpoint"]: r for r in json.load(f)["results"]}
+    print(f"{'endpoint':>10} | {'metric':>14} | {'old':>10} | {'new':>10} | {'change':>8}")
+    for endpoint in sorted(old.keys() & new.keys()):
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "error_rate", "shed_rate"):
+            before, after = old[endpoint].get(metric, 0.0), new[endpoint].get(metric, 0.0)
+            change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+            print(f"{endpoint:>10} | {metric:>14} | {before:>10} | {after:>10} | {change:>8}")
+
+def main(args):
+    with tempfile.TemporaryDirectory(prefix="rw-bench-") as keys_dir:
+        write_jwt_keys(keys_dir)
+        backend = boot_app(args)
+        args.token = seed_user(backend.app, args)
+        base_url = serve(backend.app)
+
+        started = time.time()
+        results = asyncio.run(run_scenarios(base_url, args))
+
+    load_test.print_report(results)
+    # Numbers from a run whose history writes failed leave out the indexing cost they should include
+    problems = unindexed_documents(backend)
+    if problems:
+        sys.exit("Benchmark invalid, chat history writes failed: " + "; ".join(problems))
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.fromtimestamp(started, timezone.utc).isoformat(),
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "llm_latency": args.llm_latency,
+            "llm_jitter": args.llm_jitter,
+            "llm_error_rate": args.llm_error_rate,
+            "response_cache": args.cache
+        },
+        "results": results
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="Traffic to drive (repeatable, default: all)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake provider latency in seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--cache", action="store_true", help="Leave the response cache on")
+    parser.add_argument("--email", default="bench@example.com")
+    parser.add_argument("--password", default="Bench#Passw0rd")
+    parser.add_argument("--prompt", default="Write a recursive Fibonacci function")
+    parser.add_argument("--json", help="Write the report here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two reports and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        args.scenario = args.scenario or list(SCENARIOS)
+        main(args)
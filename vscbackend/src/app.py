@@ -1,16 +1,41 @@
-from flask import Flask, request, jsonify, Blueprint
+from flask import Flask, request, jsonify, Blueprint, Response, stream_with_context, g
 from flask_cors import CORS 
 from services.auth_service import AuthService
 from utils.database import get_cassandra_session
 from services.llm_service import GroqService
 from werkzeug.serving import run_simple
 import os
+import json
+import time
 import logging
 from services.llm_middleware import LLMMiddleware
 from services.llm_middleware_v2 import LLMMiddlewareV2
+from services.llm_router import LLMRouter
+from services.llm_scheduler import QueueTimeout, PRIORITIES
+from services.batch_jobs import BatchJobManager
+from services.code_validation import CodeValidator
+from utils.metrics import REGISTRY, REQUEST_LATENCY
+from utils import tracing
+from utils.lazy_service import LazyService, ServiceNotReady, warm_up, readiness
+from utils.password_hasher import PasswordHasher
 
-middleware_v2 = LLMMiddlewareV2()
-middleware = LLMMiddleware()
+# Process pools fork here, before any client or warm-up thread exists
+hasher = PasswordHasher()
+validator = CodeValidator()
+
+def _build_middleware():
+    # LLM_BACKENDS="anthropic:claude-3-5-sonnet-20240620,groq:llama3-70b-8192" routes across providers
+    router = LLMRouter.from_env() if os.getenv("LLM_BACKENDS") else None
+    return LLMMiddleware(provider=router)
+
+# Provider clients, Elasticsearch indices and the Cassandra session are built on
+# first use (or by the warm-up thread), so importing the app never blocks on them
+session = LazyService("cassandra", get_cassandra_session)
+auth_service = LazyService("auth", lambda: AuthService(session.get(), hasher))
+middleware = LazyService("middleware", _build_middleware)
+middleware_v2 = LazyService("middleware_v2", lambda: LLMMiddlewareV2(validator=validator))
+batch_jobs = LazyService("batch_jobs", lambda: BatchJobManager(middleware.get()))
+SERVICES = (session, auth_service, middleware, batch_jobs, middleware_v2)
 
 
 # Configure logging
@@ -33,13 +58,49 @@ CORS(app, resources={
     }
 })
 
-# Initialize services with enhanced security
-session = get_cassandra_session()
-auth_service = AuthService(session)
-
 # Create blueprint for /rw endpoints
 rw_bp = Blueprint('rw', __name__, url_prefix='/rw')
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.trace_token = tracing.start_trace(request.endpoint or 'unmatched', method=request.method)
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - started,
+            endpoint=request.endpoint or 'unmatched',
+            method=request.method,
+            status=response.status_code
+        )
+    token = g.pop('trace_token', None)
+    if token is not None and response.is_streamed:
+        # SSE bodies are generated after this hook: finish once the stream closes,
+        # so the queue, llm and history_write spans land in the trace
+        trace, status = tracing.current_trace(), response.status_code
+        response.call_on_close(lambda: tracing.finish_trace(token, trace=trace, status=status))
+        if trace is not None:
+            response.headers['X-Trace-Id'] = trace.trace_id
+    elif token is not None:
+        trace = tracing.finish_trace(token, status=response.status_code)
+        if trace is not None:
+            response.headers['X-Trace-Id'] = trace.trace_id
+    return response
+
+def _not_ready_response(e: ServiceNotReady):
+    """503 while a dependency is still starting, so clients retry instead of failing"""
+    logger.warning(f"Request refused: {str(e)}")
+    return jsonify(error="Service starting, retry later"), 503, {'Retry-After': str(max(1, round(e.retry_after)))}
+
+def _busy_response(result, status):
+    """Attach Retry-After when the bcrypt pool shed the request"""
+    if status == 503:
+        return result, status, {'Retry-After': '1'}
+    return result, status
+
 @rw_bp.route('/register', methods=['POST'], strict_slashes=False)
 def register():
     """Handle user registration with input validation"""
@@ -52,8 +113,10 @@ def register():
         if len(data['password']) < 10:
             return jsonify(error="Password must be at least 10 characters"), 400
             
-        return auth_service.register_user(data['email'], data['password'])
+        return _busy_response(*auth_service.register_user(data['email'], data['password']))
         
+    except ServiceNotReady as e:
+        return _not_ready_response(e)
     except Exception as e:
         logger.error(f"Registration error: {str(e)}")
         return jsonify(error="Internal server error"), 500
@@ -72,48 +135,106 @@ def login():
         else:
             logger.warning(f"Failed login attempt for {data['email']}")
             
-        return result, status
+        return _busy_response(result, status)
         
+    except ServiceNotReady as e:
+        return _not_ready_response(e)
     except Exception as e:
         logger.error(f"Login error: {str(e)}")
         return jsonify(error="Internal server error"), 500
 
+def _authorize_request():
+    """Verify the Bearer JWT, returning (payload, error_response)"""
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        logger.warning("Missing or invalid Authorization header")
+        return None, (jsonify(error="Unauthorized"), 401)
+
+    token = auth_header.split(' ')[1]
+    with tracing.span("auth"):
+        payload = auth_service.verify_jwt(token)
+    if not payload:
+        logger.warning(f"Invalid JWT token: {token[:15]}...")
+        return None, (jsonify(error="Invalid token"), 401)
+
+    return payload, None
+
+def _validate_prompt_request(data):
+    """Validate a prompt request body, returning an error response or None"""
+    if not data or 'prompt' not in data:
+        return jsonify(error="Prompt required"), 400
+
+    if len(data['prompt']) > 2000:
+        return jsonify(error="Prompt too long"), 413
+
+    if data.get('priority', 'interactive') not in PRIORITIES:
+        return jsonify(error=f"priority must be one of: {', '.join(PRIORITIES)}"), 400
+
+    if data.get('mode', 'full') not in ('full', 'edit'):
+        return jsonify(error="mode must be 'full' or 'edit'"), 400
+
+    return None
+
+def _sse(event: str, data: dict) -> str:
+    """Format a single Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 # app.py - Updated handle_prompt() function
 @rw_bp.route('/prompt', methods=['POST'])
 def handle_prompt():
     """Process LLM prompts with conversation context"""
     try:
         # JWT Verification
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Bearer '):
-            logger.warning("Missing or invalid Authorization header")
-            return jsonify(error="Unauthorized"), 401
-
-        token = auth_header.split(' ')[1]
-        payload = auth_service.verify_jwt(token)
-        if not payload:
-            logger.warning(f"Invalid JWT token: {token[:15]}...")
-            return jsonify(error="Invalid token"), 401
+        payload, error = _authorize_request()
+        if error:
+            return error
 
         # Input validation
         data = request.get_json()
-        if not data or 'prompt' not in data:
-            return jsonify(error="Prompt required"), 400
-
-        if len(data['prompt']) > 2000:
-            return jsonify(error="Prompt too long"), 413
+        error = _validate_prompt_request(data)
+        if error:
+            return error
 
         # Extract thread parameters
         thread_id = data.get('thread_id')
         new_thread = data.get('new_thread', False)  
 
+        # Edit mode: the model returns a patch against the thread's code
+        if data.get('mode') == 'edit':
+            base_code = None
+            if thread_id and not new_thread:
+                # Threads are shared with full mode, whose chat history holds their latest code
+                with tracing.span("history_read"):
+                    base_code = middleware.latest_code(thread_id) or middleware_v2.latest_code(thread_id)
+                if not base_code:
+                    return jsonify(error="Thread has no code to edit; send a full prompt first"), 400
+            code, patch, new_thread_id = middleware_v2.generate_edit(
+                prompt=data['prompt'],
+                session_id=None if new_thread else thread_id,
+                user=payload.get('sub'),
+                priority=data.get('priority', 'interactive'),
+                base_code=base_code
+            )
+            if not code.startswith("# Error"):
+                with tracing.span("history_write"):
+                    middleware.record_exchange(new_thread_id, data['prompt'], code)
+            return jsonify({
+                "response": code,
+                "patch": patch,
+                "thread_id": new_thread_id,
+                "new_thread": new_thread
+            })
+
         # Process request with middleware
         #middleware = LLMMiddleware()
         response, new_thread_id = middleware.generate_response(
             prompt=data['prompt'],
             model=data.get('model', 'llama3-70b-8192'),
             thread_id=thread_id,
-            new_thread=new_thread
+            new_thread=new_thread,
+            user=payload.get('sub'),
+            use_cache=data.get('cache', True),  # Per-request response cache opt-out
+            priority=data.get('priority', 'interactive')
         )
 
         # Get thread/session parameters
@@ -136,24 +257,188 @@ def handle_prompt():
             "new_thread": new_thread
         })
 
+    except QueueTimeout as e:
+        logger.warning(f"Prompt shed: {str(e)}")
+        return jsonify(error="LLM provider busy, retry later"), 503, {'Retry-After': str(max(1, round(e.retry_after)))}
+    except ServiceNotReady as e:
+        return _not_ready_response(e)
     except Exception as e:
         logger.error(f"Prompt processing error: {str(e)}")
         return jsonify(error="Internal server error"), 500
 
+@rw_bp.route('/prompt/stream', methods=['POST'])
+def handle_prompt_stream():
+    """Stream LLM tokens as Server-Sent Events while they are generated"""
+    try:
+        payload, error = _authorize_request()
+        if error:
+            return error
+
+        data = request.get_json()
+        error = _validate_prompt_request(data)
+        if error:
+            return error
+
+        new_thread = data.get('new_thread', False)
+        thread_id, chunks = middleware.stream_response(
+            prompt=data['prompt'],
+            model=data.get('model', 'llama3-70b-8192'),
+            thread_id=data.get('thread_id'),
+            new_thread=new_thread,
+            user=payload.get('sub'),
+            use_cache=data.get('cache', True),
+            priority=data.get('priority', 'interactive')
+        )
+
+    except ServiceNotReady as e:
+        return _not_ready_response(e)
+    except Exception as e:
+        logger.error(f"Prompt stream setup error: {str(e)}")
+        return jsonify(error="Internal server error"), 500
+
+    def generate():
+        yield _sse("start", {"thread_id": thread_id, "new_thread": new_thread})
+        try:
+            for chunk in chunks:
+                yield _sse("token", {"token": chunk})
+            yield _sse("done", {"thread_id": thread_id, "new_thread": new_thread})
+        except QueueTimeout as e:
+            logger.warning(f"Prompt stream shed: {str(e)}")
+            yield _sse("error", {"error": "LLM provider busy, retry later", "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"Prompt streaming error: {str(e)}")
+            yield _sse("error", {"error": "# Error generating response"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Keep proxies from buffering the stream
+        }
+    )
+
+def _validate_batch_request(data):
+    """Validate a batch request body, returning an error response or None"""
+    if not data or not isinstance(data.get('items'), list) or not data['items']:
+        return jsonify(error="items must be a non-empty list"), 400
+
+    if len(data['items']) > batch_jobs.max_items:
+        return jsonify(error=f"At most {batch_jobs.max_items} items per batch"), 413
+
+    for index, item in enumerate(data['items']):
+        if not isinstance(item, dict) or not isinstance(item.get('prompt'), str):
+            return jsonify(error=f"items[{index}]: prompt required"), 400
+        if len(item['prompt']) > 2000:
+            return jsonify(error=f"items[{index}]: prompt too long"), 413
+        file = item.get('file')
+        if file is not None and (not isinstance(file, dict) or not isinstance(file.get('content', ''), str)
+                                 or not isinstance(file.get('path', ''), str)):
+            return jsonify(error=f"items[{index}]: file must be an object with string path and content"), 400
+        if file is not None and len(file.get('content', '')) > 100000:
+            return jsonify(error=f"items[{index}]: file content exceeds 100000 characters"), 413
+
+    return None
+
+@rw_bp.route('/prompt/batch', methods=['POST'])
+def handle_prompt_batch():
+    """Queue many prompts at once, returning a job id to poll or stream"""
+    try:
+        payload, error = _authorize_request()
+        if error:
+            return error
+
+        data = request.get_json()
+        error = _validate_batch_request(data)
+        if error:
+            return error
+
+        job = batch_jobs.submit(data['items'], user=payload.get('sub'), model=data.get('model'))
+        return jsonify({"job_id": job.job_id, "total": job.total}), 202
+
+    except ServiceNotReady as e:
+        return _not_ready_response(e)
+    except Exception as e:
+        logger.error(f"Batch submission error: {str(e)}")
+        return jsonify(error="Internal server error"), 500
+
+@rw_bp.route('/prompt/batch/<job_id>', methods=['GET'])
+def get_prompt_batch(job_id):
+    """Return the status and finished results of a batch job"""
+    payload, error = _authorize_request()
+    if error:
+        return error
+
+    job = batch_jobs.get(job_id, user=payload.get('sub'))
+    if job is None:
+        return jsonify(error="Batch job not found"), 404
+    return jsonify(job.status())
+
+@rw_bp.route('/prompt/batch/<job_id>/stream', methods=['GET'])
+def stream_prompt_batch(job_id):
+    """Stream batch item results as Server-Sent Events as they finish"""
+    payload, error = _authorize_request()
+    if error:
+        return error
+
+    job = batch_jobs.get(job_id, user=payload.get('sub'))
+    if job is None:
+        return jsonify(error="Batch job not found"), 404
+
+    def generate():
+        yield _sse("start", {"job_id": job.job_id, "total": job.total})
+        for result in job.iter_results():
+            if result is None:
+                yield ": keep-alive\n\n"  # Comment frame keeps idle proxies from closing the stream
+                continue
+            yield _sse("item", result)
+        status = job.status()
+        del status["results"]  # Already streamed item by item
+        yield _sse("done", status)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@rw_bp.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 200 once every lazily built service is up, 503 before"""
+    services = readiness(*SERVICES)
+    status = 200 if all(service["ready"] for service in services.values()) else 503
+    return jsonify(ready=status == 200, services=services), status
+
+@rw_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose request, per-stage, provider and pool metrics in Prometheus text format"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 # Register the blueprint
 app.register_blueprint(rw_bp)
 
+# Build everything in the background so the first requests rarely wait on it
+if os.getenv("WARMUP_ON_START", "true").lower() == "true":
+    warm_up(*SERVICES)
+
 @app.errorhandler(404)
 def handle_404(e):
     return jsonify(error="Endpoint not found"), 404
 
+@app.errorhandler(ServiceNotReady)
+def handle_not_ready(e):
+    return _not_ready_response(e)
+
 @app.errorhandler(500)
 def handle_500(e):
     logger.error("Internal server error", exc_info=True)
     return jsonify(error="Internal server error"), 500
 
 if __name__ == '__main__':
-    socket_path = '/tmp/woflx0.sock'
+    socket_path = os.getenv('RW_SOCKET_PATH', '/tmp/woflx0.sock')
     
     # Cleanup existing socket
     if os.path.exists(socket_path):
@@ -0,0 +1,318 @@
+# asgi_app.py - asyncio serving mode for the /rw API
+from quart import Quart, request, jsonify, Blueprint, Response, g
+from quart_cors import cors
+from services.async_auth_service import AsyncAuthService
+from services.llm_middleware_async import AsyncLLMMiddleware
+from services.llm_scheduler import QueueTimeout, PRIORITIES
+from utils.database import get_cassandra_session
+from utils.metrics import REGISTRY, REQUEST_LATENCY
+from utils import tracing
+from utils.lazy_service import LazyService, ServiceNotReady, RETRY_MIN, RETRY_MAX, warm_up, readiness
+from utils.password_hasher import PasswordHasher
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = Quart(__name__)
+
+# Same CORS policy as the threaded server in app.py
+app = cors(
+    app,
+    allow_origin=[
+        "https://wolfx0.com",
+        re.compile(r"vscode-webview://.*"),
+        re.compile(r"https://.*\.cloudflare\.com")
+    ],
+    allow_headers=["Authorization", "Content-Type"],
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_credentials=True
+)
+
+hasher = PasswordHasher()  # Fork the bcrypt pool before driver threads start
+# Built only by the warm-up thread: connecting blocks, and requests run on the event loop
+session = LazyService("cassandra", get_cassandra_session, build_on_demand=False)
+auth_service = LazyService("auth", lambda: AsyncAuthService(session.get(), hasher), build_on_demand=False)
+middleware = AsyncLLMMiddleware()
+middleware_ready = False
+
+rw_bp = Blueprint('rw', __name__, url_prefix='/rw')
+
+async def _initialize_middleware():
+    """Ensure the chat history index, retrying with backoff until Elasticsearch answers"""
+    global middleware_ready
+    delay = RETRY_MIN
+    while True:
+        try:
+            await middleware.initialize()
+            middleware_ready = True
+            return
+        except Exception:
+            await asyncio.sleep(delay)
+            delay = min(RETRY_MAX, delay * 2)
+
+@app.before_serving
+async def startup():
+    # Serving starts immediately; dependencies come up in the background
+    app.add_background_task(_initialize_middleware)
+    warm_up(session, auth_service)  # Always: requests never build these themselves
+
+@app.after_serving
+async def shutdown():
+    await middleware.close()
+    hasher.shutdown()
+    if session.ready:
+        session.get().cluster.shutdown()
+
+@app.before_request
+async def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.trace_token = tracing.start_trace(request.endpoint or 'unmatched', method=request.method)
+
+@app.after_request
+async def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - started,
+            endpoint=request.endpoint or 'unmatched',
+            method=request.method,
+            status=response.status_code
+        )
+    token = g.pop('trace_token', None)
+    if token is not None:
+        trace = tracing.finish_trace(token, status=response.status_code)
+        if trace is not None:
+            response.headers['X-Trace-Id'] = trace.trace_id
+    return response
+
+def _not_ready_response(e: ServiceNotReady):
+    """503 while a dependency is still starting, so clients retry instead of failing"""
+    logger.warning(f"Request refused: {str(e)}")
+    return jsonify(error="Service starting, retry later"), 503, {'Retry-After': str(max(1, round(e.retry_after)))}
+
+def _busy_response(result, status):
+    """Attach Retry-After when the bcrypt pool shed the request"""
+    if status == 503:
+        return result, status, {'Retry-After': '1'}
+    return result, status
+
+@rw_bp.route('/register', methods=['POST'], strict_slashes=False)
+async def register():
+    """Handle user registration with input validation"""
+    try:
+        data = await request.get_json()
+        if not data or 'email' not in data or 'password' not in data:
+            return jsonify(error="Invalid request format"), 400
+
+        if len(data['password']) < 10:
+            return jsonify(error="Password must be at least 10 characters"), 400
+
+        return _busy_response(*await auth_service.register_user(data['email'], data['password']))
+
+    except ServiceNotReady as e:
+        return _not_ready_response(e)
+    except Exception as e:
+        logger.error(f"Registration error: {str(e)}")
+        return jsonify(error="Internal server error"), 500
+
+@rw_bp.route('/login', methods=['POST'], strict_slashes=False)
+async def login():
+    """Handle user login with security logging"""
+    try:
+        data = await request.get_json()
+        if not data or 'email' not in data or 'password' not in data:
+            return jsonify(error="Invalid request format"), 400
+
+        result, status = await auth_service.login_user(data['email'], data['password'])
+        if status == 200:
+            logger.info(f"Successful login for {data['email']}")
+        else:
+            logger.warning(f"Failed login attempt for {data['email']}")
+
+        return _busy_response(result, status)
+
+    except ServiceNotReady as e:
+        return _not_ready_response(e)
+    except Exception as e:
+        logger.error(f"Login error: {str(e)}")
+        return jsonify(error="Internal server error"), 500
+
+def _authorize_request():
+    """Verify the Bearer JWT, returning (payload, error_response)"""
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        logger.warning("Missing or invalid Authorization header")
+        return None, (jsonify(error="Unauthorized"), 401)
+
+    token = auth_header.split(' ')[1]
+    with tracing.span("auth"):
+        payload = auth_service.verify_jwt(token)
+    if not payload:
+        logger.warning(f"Invalid JWT token: {token[:15]}...")
+        return None, (jsonify(error="Invalid token"), 401)
+
+    return payload, None
+
+def _validate_prompt_request(data):
+    """Validate a prompt request body, returning an error response or None"""
+    if not data or 'prompt' not in data:
+        return jsonify(error="Prompt required"), 400
+
+    if len(data['prompt']) > 2000:
+        return jsonify(error="Prompt too long"), 413
+
+    if data.get('priority', 'interactive') not in PRIORITIES:
+        return jsonify(error=f"priority must be one of: {', '.join(PRIORITIES)}"), 400
+
+    return None
+
+def _sse(event: str, data: dict) -> str:
+    """Format a single Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@rw_bp.route('/prompt', methods=['POST'])
+async def handle_prompt():
+    """Process LLM prompts with conversation context"""
+    try:
+        payload, error = _authorize_request()
+        if error:
+            return error
+
+        data = await request.get_json()
+        error = _validate_prompt_request(data)
+        if error:
+            return error
+
+        new_thread = data.get('new_thread', False)
+        response, new_thread_id = await middleware.generate_response(
+            prompt=data['prompt'],
+            model=data.get('model', 'llama3-70b-8192'),
+            thread_id=data.get('thread_id'),
+            new_thread=new_thread,
+            user=payload.get('sub'),
+            use_cache=data.get('cache', True),
+            priority=data.get('priority', 'interactive')
+        )
+
+        return jsonify({
+            "response": response,
+            "thread_id": new_thread_id,
+            "new_thread": new_thread
+        })
+
+    except QueueTimeout as e:
+        logger.warning(f"Prompt shed: {str(e)}")
+        return jsonify(error="LLM provider busy, retry later"), 503, {'Retry-After': str(max(1, round(e.retry_after)))}
+    except ServiceNotReady as e:
+        return _not_ready_response(e)
+    except Exception as e:
+        logger.error(f"Prompt processing error: {str(e)}")
+        return jsonify(error="Internal server error"), 500
+
+@rw_bp.route('/prompt/stream', methods=['POST'])
+async def handle_prompt_stream():
+    """Stream LLM tokens as Server-Sent Events while they are generated"""
+    try:
+        payload, error = _authorize_request()
+        if error:
+            return error
+
+        data = await request.get_json()
+        error = _validate_prompt_request(data)
+        if error:
+            return error
+
+        new_thread = data.get('new_thread', False)
+        thread_id, chunks = await middleware.stream_response(
+            prompt=data['prompt'],
+            model=data.get('model', 'llama3-70b-8192'),
+            thread_id=data.get('thread_id'),
+            new_thread=new_thread,
+            user=payload.get('sub'),
+            use_cache=data.get('cache', True),
+            priority=data.get('priority', 'interactive')
+        )
+
+    except ServiceNotReady as e:
+        return _not_ready_response(e)
+    except Exception as e:
+        logger.error(f"Prompt stream setup error: {str(e)}")
+        return jsonify(error="Internal server error"), 500
+
+    # The body is generated after the request hooks run, so the stream finishes its own trace
+    trace, token = tracing.current_trace(), g.pop('trace_token', None)
+
+    async def generate():
+        yield _sse("start", {"thread_id": thread_id, "new_thread": new_thread})
+        try:
+            async for chunk in chunks:
+                yield _sse("token", {"token": chunk})
+            yield _sse("done", {"thread_id": thread_id, "new_thread": new_thread})
+        except QueueTimeout as e:
+            logger.warning(f"Prompt stream shed: {str(e)}")
+            yield _sse("error", {"error": "LLM provider busy, retry later", "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"Prompt streaming error: {str(e)}")
+            yield _sse("error", {"error": "# Error generating response"})
+        finally:
+            if token is not None:
+                tracing.finish_trace(token, trace=trace, status=200)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    if trace is not None:
+        response.headers['X-Trace-Id'] = trace.trace_id
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.timeout = None  # Generation can outlive the default response timeout
+    return response
+
+@rw_bp.route('/ready', methods=['GET'])
+async def ready():
+    """Readiness probe: 200 once Cassandra, auth and the history index are up, 503 before"""
+    services = readiness(session, auth_service)
+    services["middleware"] = {"ready": middleware_ready}
+    status = 200 if all(service["ready"] for service in services.values()) else 503
+    return jsonify(ready=status == 200, services=services), status
+
+@rw_bp.route('/metrics', methods=['GET'])
+async def metrics():
+    """Expose request and bcrypt pool metrics in Prometheus text format"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# Register the blueprint
+app.register_blueprint(rw_bp)
+
+@app.errorhandler(404)
+async def handle_404(e):
+    return jsonify(error="Endpoint not found"), 404
+
+@app.errorhandler(500)
+async def handle_500(e):
+    logger.error("Internal server error", exc_info=True)
+    return jsonify(error="Internal server error"), 500
+
+if __name__ == '__main__':
+    from hypercorn.config import Config
+    from hypercorn.asyncio import serve
+
+    socket_path = os.getenv('RW_SOCKET_PATH', '/tmp/woflx0.sock')
+
+    # Cleanup existing socket
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    config = Config()
+    config.bind = ['unix:' + socket_path]
+    config.keep_alive_timeout = 75
+    if os.path.exists('/etc/ssl/cloudflare/cert.pem'):
+        config.certfile = '/etc/ssl/cloudflare/cert.pem'
+        config.keyfile = '/etc/ssl/cloudflare/key.pem'
+
+    asyncio.run(serve(app, config))
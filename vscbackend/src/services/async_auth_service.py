@@ -0,0 +1,70 @@
+# services/async_auth_service.py
+from datetime import datetime
+from typing import Tuple, Dict
+from services.auth_service import AuthService
+from utils.password_hasher import HasherSaturated
+from utils.async_database import execute_async, fetch_one
+
+class AsyncAuthService(AuthService):
+    """AuthService variant for the ASGI server.
+
+    Cassandra round trips are awaited on the driver's async API and bcrypt is
+    awaited on the bounded process pool, so neither blocks the event loop.
+    Validation and JWT handling are inherited unchanged.
+    """
+
+    async def register_user(self, email: str, password: str) -> Tuple[Dict, int]:
+        """Register a new user with email and password"""
+        try:
+            # Validate inputs
+            if not self.validate_email(email):
+                return {"error": "Invalid email format"}, 400
+
+            if not self.validate_password(password):
+                return {"error": "Password must be 8+ characters with uppercase, lowercase, number, and symbol"}, 400
+
+            # Check if user exists
+            existing = await fetch_one(self.session, self.queries["user_exists"], [email])
+            if existing:
+                return {"error": "Email already registered"}, 409
+
+            # Hash password on the bounded bcrypt pool
+            hashed_pw = await self.hasher.hash_password_async(password)
+
+            # Store user in Cassandra
+            await execute_async(
+                self.session,
+                self.queries["insert_user"],
+                [email, hashed_pw, datetime.now()]
+            )
+
+            # Generate JWT token
+            token = self._generate_jwt(email)
+            return {"token": token}, 201
+
+        except HasherSaturated:
+            return {"error": "Server busy, please retry"}, 503
+        except Exception as e:
+            return {"error": str(e)}, 500
+
+    async def login_user(self, email: str, password: str) -> Tuple[Dict, int]:
+        """Authenticate existing user"""
+        try:
+            # Get user from database
+            user = await fetch_one(self.session, self.queries["get_user"], [email])
+
+            if not user:
+                return {"error": "Invalid credentials"}, 401
+
+            # Verify password on the bounded bcrypt pool
+            if not await self.hasher.check_password_async(password, user.password):
+                return {"error": "Invalid credentials"}, 401
+
+            # Generate JWT token
+            token = self._generate_jwt(email)
+            return {"token": token}, 200
+
+        except HasherSaturated:
+            return {"error": "Server busy, please retry"}, 503
+        except Exception as e:
+            return {"error": str(e)}, 500
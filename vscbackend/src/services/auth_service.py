@@ -1,37 +1,54 @@
 # backend/src/services/auth_service.py
-from cassandra.cluster import Cluster
-from cassandra.query import dict_factory
-import bcrypt
+from cassandra import InvalidRequest
 import re
 import os
 import jwt
 from datetime import datetime, timedelta
 from typing import Tuple, Dict, Optional
 from dotenv import load_dotenv
+from utils.password_hasher import PasswordHasher, HasherSaturated
+from utils.statements import StatementCache
+from utils.jwt_cache import KeyFileCache, VerifiedTokenCache, load_private_key, load_public_key
 
 load_dotenv()
 
+USER_QUERIES = {
+    "user_exists": "SELECT email FROM users WHERE email = ?",
+    "get_user": "SELECT email, password FROM users WHERE email = ?",
+    "insert_user": "INSERT INTO users (email, password, created_at) VALUES (?, ?, ?)",
+}
+
 class AuthService:
-    def __init__(self, session):
+    def __init__(self, session, hasher: PasswordHasher = None):
         self.session = session
+        # bcrypt runs on a bounded process pool, never on the request thread
+        self.hasher = hasher or PasswordHasher()
         # RSA Configuration
         self.JWT_ALGORITHM = "RS256"
         self.JWT_EXPIRATION = timedelta(days=90)
-        self.JWT_PRIVATE_KEY_PATH = "/etc/ssl/jwt/private.pem"  # Updated secure path
-        self.JWT_PUBLIC_KEY_PATH = "/etc/ssl/jwt/public.pem"    # Updated secure path
-
-        # Initialize Cassandra schema
-        self._initialize_schema()
-
-    def _initialize_schema(self):
-        """Create required Cassandra tables if they don't exist"""
-        self.session.execute(
-            "CREATE TABLE IF NOT EXISTS users ("
-            "email text PRIMARY KEY, "
-            "password text, "
-            "created_at timestamp)"
+        self.JWT_PRIVATE_KEY_PATH = os.getenv("JWT_PRIVATE_KEY_PATH", "/etc/ssl/jwt/private.pem")  # Updated secure path
+        self.JWT_PUBLIC_KEY_PATH = os.getenv("JWT_PUBLIC_KEY_PATH", "/etc/ssl/jwt/public.pem")      # Updated secure path
+
+        # Parsed keys are reloaded only when the PEM files change; verified
+        # tokens are remembered so repeat requests skip the RSA verification
+        self._verified_tokens = VerifiedTokenCache(
+            maxsize=int(os.getenv("JWT_CACHE_SIZE", "10000")),
+            ttl=float(os.getenv("JWT_CACHE_TTL", "300"))
+        )
+        self._private_key = KeyFileCache(self.JWT_PRIVATE_KEY_PATH, load_private_key)
+        self._public_key = KeyFileCache(
+            self.JWT_PUBLIC_KEY_PATH,
+            load_public_key,
+            on_reload=self._verified_tokens.clear  # Key rotation invalidates cached tokens
         )
 
+        # Prepare every query once; the schema itself comes from utils.migrations
+        self.statements = StatementCache(session)
+        try:
+            self.queries = self.statements.prepare_all(USER_QUERIES)
+        except InvalidRequest as e:
+            raise RuntimeError(f"Users schema missing, run `python -m utils.migrations`: {str(e)}")
+
     def validate_email(self, email: str) -> bool:
         """Validate email format using regex"""
         return re.match(r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$", email) is not None
@@ -55,17 +72,16 @@ class AuthService:
                 return {"error": "Password must be 8+ characters with uppercase, lowercase, number, and symbol"}, 400
 
             # Check if user exists
-            query = "SELECT email FROM users WHERE email = %s"
-            existing = self.session.execute(query, [email]).one()
+            existing = self.session.execute(self.queries["user_exists"], [email]).one()
             if existing:
                 return {"error": "Email already registered"}, 409
 
             # Hash password
-            hashed_pw = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+            hashed_pw = self.hasher.hash_password(password)
 
             # Store user in Cassandra
             self.session.execute(
-                "INSERT INTO users (email, password, created_at) VALUES (%s, %s, %s)",
+                self.queries["insert_user"],
                 [email, hashed_pw, datetime.now()]
             )
 
@@ -73,6 +89,8 @@ class AuthService:
             token = self._generate_jwt(email)
             return {"token": token}, 201
 
+        except HasherSaturated:
+            return {"error": "Server busy, please retry"}, 503
         except Exception as e:
             return {"error": str(e)}, 500
 
@@ -80,28 +98,28 @@ class AuthService:
         """Authenticate existing user"""
         try:
             # Get user from database
-            query = "SELECT * FROM users WHERE email = %s"
-            user = self.session.execute(query, [email]).one()
+            user = self.session.execute(self.queries["get_user"], [email]).one()
 
             if not user:
                 return {"error": "Invalid credentials"}, 401
 
             # Verify password
-            if not bcrypt.checkpw(password.encode(), user.password.encode()):
+            if not self.hasher.check_password(password, user.password):
                 return {"error": "Invalid credentials"}, 401
 
             # Generate JWT token
             token = self._generate_jwt(email)
             return {"token": token}, 200
 
+        except HasherSaturated:
+            return {"error": "Server busy, please retry"}, 503
         except Exception as e:
             return {"error": str(e)}, 500
 
     def _generate_jwt(self, email: str) -> str:
         """Generate JWT token using RSA private key"""
         try:
-            with open(self.JWT_PRIVATE_KEY_PATH, "r") as f:
-                private_key = f.read()
+            private_key = self._private_key.get()
             
             payload = {
                 "sub": email,
@@ -117,15 +135,20 @@ class AuthService:
     def verify_jwt(self, token: str) -> Optional[Dict]:
         """Verify JWT token using RSA public key"""
         try:
-            with open(self.JWT_PUBLIC_KEY_PATH, "r") as f:
-                public_key = f.read()
-            
-            return jwt.decode(
+            public_key = self._public_key.get()
+
+            payload = self._verified_tokens.get(token)
+            if payload is not None:
+                return payload
+
+            payload = jwt.decode(
                 token,
                 public_key,
                 algorithms=[self.JWT_ALGORITHM],
                 options={"verify_aud": False}
             )
+            self._verified_tokens.put(token, payload)
+            return payload
         
         except FileNotFoundError:
             raise RuntimeError("JWT public key not found at specified path")
@@ -135,4 +158,3 @@ class AuthService:
             return None
         except jwt.InvalidTokenError:
             return None
-
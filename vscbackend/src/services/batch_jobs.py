@@ -0,0 +1,154 @@
+# services/batch_jobs.py
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from services.llm_scheduler import QueueTimeout
+from services.context_builder import ContextBuilder, ContextTooLarge
+
+logger = logging.getLogger(__name__)
+
+def build_item_prompt(item: dict, context_builder: ContextBuilder = None) -> str:
+    """Prepend the optional file context to an item's prompt.
+
+    The file is what the item asks to change, so it is sent whole; one over
+    the context builder's target budget raises ContextTooLarge.
+    """
+    file = item.get("file")
+    if not file:
+        return item["prompt"]
+    content = file.get("content", "")
+    if context_builder is not None:
+        content = context_builder.fit_target(content)
+    return f"File {file.get('path', '')}:\n{content}\n\nTask: {item['prompt']}"
+
+class BatchJob:
+    """Per-item results of one batch, in completion order"""
+
+    def __init__(self, job_id: str, user: str, items: list):
+        self.job_id = job_id
+        self.user = user
+        self.total = len(items)
+        self.results = []  # Appended as items finish
+        self.created_at = time.time()
+        self.finished_at = None
+        self._cond = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return len(self.results) == self.total
+
+    def add_result(self, result: dict):
+        with self._cond:
+            self.results.append(result)
+            if self.done:
+                self.finished_at = time.time()
+            self._cond.notify_all()
+
+    def wait_for(self, seen: int, timeout: float = None) -> list:
+        """Block until results beyond the first `seen` exist, returning them"""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self.results) > seen or self.done, timeout=timeout)
+            return self.results[seen:]
+
+    def iter_results(self, heartbeat: float = 15.0):
+        """Yield each result as it lands, or None after `heartbeat` idle seconds"""
+        seen = 0
+        while True:
+            fresh = self.wait_for(seen, timeout=heartbeat)
+            if not fresh:
+                if self.done:
+                    return
+                yield None
+                continue
+            seen += len(fresh)
+            yield from fresh
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "job_id": self.job_id,
+                "status": "done" if self.done else "running",
+                "total": self.total,
+                "completed": len(self.results),
+                "failed": sum(1 for r in self.results if r["status"] != "ok"),
+                "results": sorted(self.results, key=lambda r: r["index"])
+            }
+
+class BatchJobManager:
+    """Runs batches of prompts concurrently through a middleware.
+
+    Items are submitted to a shared worker pool as batch-priority calls, so
+    the provider scheduler keeps them within the rate limits and behind
+    interactive traffic. Finished jobs are kept for `ttl` seconds.
+    """
+
+    def __init__(self, middleware, max_workers: int = None, max_items: int = None, ttl: float = None):
+        self.middleware = middleware
+        self.max_items = max_items or int(os.getenv("BATCH_MAX_ITEMS", "100"))
+        self.ttl = ttl or float(os.getenv("BATCH_JOB_TTL", "3600"))
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv("BATCH_MAX_WORKERS", "16")),
+            thread_name_prefix="batch-prompt"
+        )
+        self.context_builder = ContextBuilder()  # Files over the target budget are rejected per item
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, items: list, user: str = None, model: str = None) -> BatchJob:
+        if not items:
+            raise ValueError("At least one item is required")
+        if len(items) > self.max_items:
+            raise ValueError(f"At most {self.max_items} items per batch")
+
+        job = BatchJob(str(uuid.uuid4()), user, items)
+        with self._lock:
+            self._expire()
+            self._jobs[job.job_id] = job
+        logger.info(f"Batch {job.job_id}: {job.total} items for {user}")
+
+        for index, item in enumerate(items):
+            self._executor.submit(self._run_item, job, index, item, model)
+        return job
+
+    def _run_item(self, job: BatchJob, index: int, item: dict, model: str):
+        started = time.perf_counter()
+        result = {"index": index, "path": (item.get("file") or {}).get("path")}
+        try:
+            kwargs = {"model": model} if model else {}
+            response, thread_id = self.middleware.generate_response(
+                prompt=build_item_prompt(item, self.context_builder),
+                thread_id=item.get("thread_id"),
+                new_thread=item.get("new_thread", False),
+                user=job.user,
+                use_cache=item.get("cache", True),
+                priority="batch",
+                **kwargs
+            )
+            # Provider failures come back as an "# Error ..." placeholder, not an exception
+            failed = thread_id == "error" or response.startswith("# Error")
+            result.update(status="error" if failed else "ok", response=response, thread_id=thread_id)
+        except QueueTimeout as e:
+            result.update(status="error", error="LLM provider busy", retry_after=e.retry_after)
+        except ContextTooLarge as e:
+            result.update(status="error", error=str(e))
+        except Exception as e:
+            logger.error(f"Batch {job.job_id} item {index} failed: {str(e)}")
+            result.update(status="error", error="Internal server error")
+        result["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        job.add_result(result)
+
+    def get(self, job_id: str, user: str = None):
+        """Return the job if it exists and belongs to `user`"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.user != user:
+            return None
+        return job
+
+    def _expire(self):
+        now = time.time()
+        for job_id in [j for j, job in self._jobs.items() if job.finished_at and now - job.finished_at > self.ttl]:
+            del self._jobs[job_id]
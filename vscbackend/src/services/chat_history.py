@@ -0,0 +1,133 @@
+# services/chat_history.py
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from langchain_core.messages import HumanMessage, AIMessage, message_to_dict, messages_from_dict
+
+logger = logging.getLogger(__name__)
+
+class ChatHistoryStore:
+    """Recent-turn access to LangChain-format chat history in Elasticsearch.
+
+    Only the last `turns` messages of a thread are ever fetched, with a sorted,
+    size-limited query, and they are kept in a per-thread ring buffer so a
+    follow-up prompt usually needs no read at all. Per-turn cost therefore
+    stays flat however long a thread grows.
+    """
+
+    def __init__(self, es, index_name: str, turns: int = 3, max_threads: int = None, ttl: float = None,
+                 writer=None):
+        self.es = es
+        self.writer = writer  # Optional BulkWriter; writes go straight to ES without one
+        self.index_name = index_name
+        self.turns = turns
+        self.max_threads = max_threads or int(os.getenv("CHAT_HISTORY_CACHE_THREADS", "1024"))
+        # Bounds staleness when another worker process appends to the same thread
+        self.ttl = ttl if ttl is not None else float(os.getenv("CHAT_HISTORY_CACHE_TTL", "300"))
+        self._buffers = OrderedDict()  # thread_id -> (deque of messages, loaded_at)
+        self._last_created_at = 0
+        self._lock = threading.Lock()
+
+    def thread(self, thread_id: str) -> "ThreadHistory":
+        """Return a lightweight history view bound to one thread"""
+        return ThreadHistory(self, thread_id)
+
+    def _cached(self, thread_id: str):
+        with self._lock:
+            entry = self._buffers.get(thread_id)
+            if entry is None:
+                return None
+            buffer, loaded_at = entry
+            if time.monotonic() - loaded_at > self.ttl:
+                del self._buffers[thread_id]
+                return None
+            self._buffers.move_to_end(thread_id)
+            return list(buffer)
+
+    def _remember(self, thread_id: str, messages: list, extend: bool = False):
+        with self._lock:
+            entry = self._buffers.get(thread_id)
+            if extend and entry is None:
+                return  # Unknown thread: the next read loads it from Elasticsearch
+            if extend:
+                entry[0].extend(messages)
+            else:
+                self._buffers[thread_id] = (deque(messages, maxlen=self.turns), time.monotonic())
+            self._buffers.move_to_end(thread_id)
+            while len(self._buffers) > self.max_threads:
+                self._buffers.popitem(last=False)
+
+    def _next_created_at(self) -> int:
+        """Millisecond timestamp that is strictly increasing within this process"""
+        with self._lock:
+            self._last_created_at = max(round(time.time() * 1000), self._last_created_at + 1)
+            return self._last_created_at
+
+    def recent(self, thread_id: str) -> list:
+        """Return the last `turns` messages of a thread, oldest first"""
+        cached = self._cached(thread_id)
+        if cached is not None:
+            return cached
+
+        result = self.es.search(
+            index=self.index_name,
+            query={"term": {"session_id": thread_id}},
+            sort="created_at:desc",
+            size=self.turns
+        )
+        documents = [json.loads(hit["_source"]["history"]) for hit in result["hits"]["hits"]]
+        messages = messages_from_dict(list(reversed(documents)))
+        self._remember(thread_id, messages)
+        return messages
+
+    def add_messages(self, thread_id: str, messages: list):
+        """Append messages to a thread"""
+        # The ring buffer is updated first so reads see the turn before the
+        # write-behind queue has flushed it to Elasticsearch
+        self._remember(thread_id, messages, extend=True)
+        for message in messages:
+            document = {
+                "session_id": thread_id,
+                "created_at": self._next_created_at(),
+                "history": json.dumps(message_to_dict(message))
+            }
+            if self.writer:
+                self.writer.add(self.index_name, document)
+            else:
+                self.es.index(index=self.index_name, document=document, refresh=True)
+
+    def clear(self, thread_id: str):
+        """Delete every message stored for a thread"""
+        self.es.delete_by_query(
+            index=self.index_name,
+            query={"term": {"session_id": thread_id}},
+            refresh=True
+        )
+        self._remember(thread_id, [])
+
+class ThreadHistory:
+    """Thread-bound view with the subset of LangChain's history API we use"""
+
+    def __init__(self, store: ChatHistoryStore, thread_id: str):
+        self.store = store
+        self.thread_id = thread_id
+
+    @property
+    def messages(self) -> list:
+        return self.store.recent(self.thread_id)
+
+    def add_user_message(self, content: str):
+        self.store.add_messages(self.thread_id, [HumanMessage(content=content)])
+
+    def add_ai_message(self, content: str):
+        self.store.add_messages(self.thread_id, [AIMessage(content=content)])
+
+    def add_exchange(self, prompt: str, response: str):
+        """Store a user prompt and its answer together"""
+        self.store.add_messages(self.thread_id, [HumanMessage(content=prompt), AIMessage(content=response)])
+
+    def clear(self):
+        self.store.clear(self.thread_id)
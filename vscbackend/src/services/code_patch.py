@@ -0,0 +1,49 @@
+# services/code_patch.py
+import re
+from typing import List, Tuple
+
+EDIT_BLOCK = re.compile(
+    r"<<<<<<< SEARCH\n(.*?)\n?=======\n(.*?)\n?>>>>>>> REPLACE",
+    re.DOTALL
+)
+
+class PatchError(ValueError):
+    """Raised when an edit cannot be applied unambiguously to the stored code"""
+
+def parse_edit_blocks(text: str) -> List[Tuple[str, str]]:
+    """Extract (search, replace) pairs from a SEARCH/REPLACE formatted response"""
+    blocks = EDIT_BLOCK.findall(text.replace("\r\n", "\n"))
+    if not blocks:
+        raise PatchError("Response contains no SEARCH/REPLACE blocks")
+    return blocks
+
+def _locate(code: str, search: str) -> Tuple[int, int]:
+    """Find the single span of `code` matching `search`, tolerating trailing whitespace"""
+    count = code.count(search)
+    if count == 1:
+        start = code.index(search)
+        return start, start + len(search)
+    if count > 1:
+        raise PatchError(f"SEARCH block matches {count} places: {search.splitlines()[0][:60]!r}")
+
+    # Fall back to a line-wise match ignoring trailing whitespace
+    lines = code.split("\n")
+    wanted = [line.rstrip() for line in search.split("\n")]
+    matches = [i for i in range(len(lines) - len(wanted) + 1)
+               if [line.rstrip() for line in lines[i:i + len(wanted)]] == wanted]
+    if len(matches) != 1:
+        first = search.splitlines()[0][:60] if search else ""
+        raise PatchError(f"SEARCH block matches {len(matches)} places: {first!r}")
+    start = sum(len(line) + 1 for line in lines[:matches[0]])
+    end = start + len("\n".join(lines[matches[0]:matches[0] + len(wanted)]))
+    return start, end
+
+def apply_edit_blocks(code: str, blocks: List[Tuple[str, str]]) -> str:
+    """Apply each edit in order; an empty SEARCH appends to the end of the file"""
+    for search, replace in blocks:
+        if not search.strip():
+            code = f"{code.rstrip()}\n\n{replace}" if code.strip() else replace
+            continue
+        start, end = _locate(code, search)
+        code = code[:start] + replace + code[end:]
+    return code
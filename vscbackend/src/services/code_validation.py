@@ -0,0 +1,210 @@
+# services/code_validation.py
+import os
+import re
+import ast
+import sys
+import time
+import signal
+import hashlib
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from utils.metrics import REGISTRY
+
+VALIDATION_LATENCY = REGISTRY.histogram(
+    "rw_code_validation_duration_seconds",
+    "Generated-code validation latency per check",
+    labelnames=("check", "outcome")
+)
+VALIDATION_CACHE = REGISTRY.counter(
+    "rw_code_validation_cache_total",
+    "Validation cache lookups by result",
+    labelnames=("result",)
+)
+
+def diagnostic(check: str, message: str, severity: str = "error", line: int = None) -> dict:
+    return {"check": check, "severity": severity, "message": message, "line": line}
+
+def check_ast(code: str, context: str = "", tests: str = None) -> list:
+    """Syntax, and that the code keeps the main function of the code it replaces"""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return [diagnostic("ast", f"Invalid Python syntax: {e.msg}", line=e.lineno)]
+
+    diagnostics = []
+    context_func = re.search(r'def\s+(\w+)\s*\(', context or "")
+    defined = {node.name for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))}
+    if context_func and context_func.group(1) not in defined:
+        diagnostics.append(diagnostic("ast", f"Core function {context_func.group(1)}() changed or removed"))
+    if not tree.body:
+        diagnostics.append(diagnostic("ast", "No code generated"))
+    return diagnostics
+
+def check_lint(code: str, context: str = "", tests: str = None) -> list:
+    """pyflakes findings as warnings; skipped if pyflakes is missing"""
+    try:
+        from pyflakes import api
+        from pyflakes.reporter import Reporter
+    except ImportError:
+        return [diagnostic("lint", "pyflakes not installed, lint skipped", severity="info")]
+
+    class Collector(Reporter):
+        def __init__(self):
+            self.found = []
+
+        def unexpectedError(self, filename, message):
+            self.found.append(diagnostic("lint", str(message)))
+
+        def syntaxError(self, filename, message, lineno, offset, text):
+            self.found.append(diagnostic("lint", message, line=lineno))
+
+        def flake(self, message):
+            self.found.append(diagnostic("lint", message.message % message.message_args,
+                                         severity="warning", line=message.lineno))
+
+    collector = Collector()
+    api.check(code, "<generated>", collector)
+    return collector.found
+
+def _limit_resources():
+    """Applied in the test subprocess before exec"""
+    import resource
+    memory = int(os.getenv("CODE_VALIDATION_TEST_MEMORY_MB", "256")) * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (1024 * 1024, 1024 * 1024))
+
+def check_tests(code: str, context: str = "", tests: str = None, timeout: float = 10.0) -> list:
+    """Run assert-style tests against the code in an isolated, resource-limited interpreter"""
+    if not tests:
+        return []
+    with tempfile.TemporaryDirectory(prefix="rw-validate-") as workdir:
+        path = os.path.join(workdir, "test_generated.py")
+        with open(path, "w") as f:
+            f.write(f"{code}\n\n{tests}\n")
+        try:
+            result = subprocess.run(
+                [sys.executable, "-I", "-S", path],
+                cwd=workdir,
+                env={},
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+                preexec_fn=_limit_resources
+            )
+        except subprocess.TimeoutExpired:
+            return [diagnostic("tests", f"Tests timed out after {timeout:g}s")]
+    if result.returncode != 0:
+        tail = (result.stderr or result.stdout).strip().splitlines()[-5:]
+        return [diagnostic("tests", "\n".join(tail) or f"Tests exited with {result.returncode}")]
+    return []
+
+DEFAULT_CHECKS = {
+    "ast": (check_ast, 2.0, True),
+    "lint": (check_lint, 5.0, False),
+    "tests": (check_tests, 15.0, True),
+}
+
+class CheckTimeout(Exception):
+    """A check ran longer than its timeout"""
+
+def _raise_timeout(signum, frame):
+    raise CheckTimeout()
+
+def _run_check(check, timeout: float, code: str, context: str, tests: str) -> list:
+    """Run one check in a pool worker, timed from when it starts rather than when it was queued"""
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return check(code, context, tests)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+class CodeValidator:
+    """Runs independent validation checks on generated code in parallel.
+
+    Checks are module-level functions `(code, context, tests) -> diagnostics`
+    registered under a name with a timeout, and run concurrently on a process
+    pool. The timeout starts when the check starts running, and the worker
+    interrupts a check that overruns it. The overrun is reported as an error
+    for a required check and as a warning for an optional one (lint), so a
+    slow linter never rejects working code. A check still queued after
+    `queue_timeout` is dropped the same way. Reports are cached by hash of
+    the inputs.
+    """
+
+    def __init__(self, workers: int = None, cache_size: int = None, checks: dict = None, queue_timeout: float = None):
+        self.workers = workers or int(os.getenv("CODE_VALIDATION_WORKERS", min(4, os.cpu_count() or 1)))
+        self.cache_size = cache_size or int(os.getenv("CODE_VALIDATION_CACHE_SIZE", "2048"))
+        self.queue_timeout = queue_timeout or float(os.getenv("CODE_VALIDATION_QUEUE_TIMEOUT", "30"))
+        self.checks = dict(checks if checks is not None else DEFAULT_CHECKS)
+        # Forked eagerly, like the bcrypt pool, before other threads start
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("fork")
+        )
+        self._executor.submit(int).result()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, name: str, check, timeout: float = 5.0, required: bool = True):
+        """Add or replace a check; it must be picklable (a module-level function)"""
+        self.checks[name] = (check, timeout, required)
+
+    @staticmethod
+    def _key(code: str, context: str, tests: str) -> str:
+        return hashlib.sha256("\x00".join((code, context or "", tests or "")).encode()).hexdigest()
+
+    def validate(self, code: str, context: str = "", tests: str = None) -> dict:
+        """Return {"ok", "diagnostics", "cached"}; ok is False if any check reported an error"""
+        key = self._key(code, context, tests)
+        with self._lock:
+            report = self._cache.get(key)
+            if report is not None:
+                self._cache.move_to_end(key)
+        if report is not None:
+            VALIDATION_CACHE.inc(result="hit")
+            return dict(report, cached=True)
+        VALIDATION_CACHE.inc(result="miss")
+
+        started = time.perf_counter()
+        futures = {
+            name: (self._executor.submit(_run_check, check, timeout, code, context, tests), timeout, required)
+            for name, (check, timeout, required) in self.checks.items()
+        }
+        diagnostics = []
+        for name, (future, timeout, required) in futures.items():
+            severity = "error" if required else "warning"
+            # The worker enforces the check's own timeout; this only bounds the wait for a free worker
+            remaining = max(0.0, started + self.queue_timeout + timeout - time.perf_counter())
+            try:
+                found = future.result(timeout=remaining)
+                outcome = "fail" if any(d["severity"] == "error" for d in found) else "pass"
+            except CheckTimeout:
+                found = [diagnostic(name, f"Check timed out after {timeout:g}s", severity=severity)]
+                outcome = "timeout"
+            except FutureTimeout:
+                future.cancel()  # Drops it if still queued; a running check is stopped by its worker
+                found = [diagnostic(name, "Check not finished: validation workers busy", severity=severity)]
+                outcome = "queued"
+            except Exception as e:
+                found = [diagnostic(name, f"Check crashed: {str(e)}", severity=severity)]
+                outcome = "crash"
+            VALIDATION_LATENCY.observe(time.perf_counter() - started, check=name, outcome=outcome)
+            diagnostics.extend(found)
+
+        report = {"ok": not any(d["severity"] == "error" for d in diagnostics), "diagnostics": diagnostics}
+        if not any(d["message"].startswith(("Check timed out", "Check not finished", "Check crashed")) for d in diagnostics):
+            with self._lock:
+                self._cache[key] = report
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return dict(report, cached=False)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,182 @@
+# services/context_builder.py
+import os
+import ast
+import difflib
+import logging
+from utils.metrics import REGISTRY
+
+try:
+    import tiktoken  # Optional: exact counts for OpenAI-style models, closer estimates elsewhere
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+TOKEN_BUCKETS = (0, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+
+CONTEXT_TOKENS = REGISTRY.counter(
+    "rw_context_tokens_total",
+    "Thread context tokens before (raw) and after (sent) budgeting",
+    labelnames=("kind",)
+)
+CONTEXT_TOKENS_SAVED = REGISTRY.histogram(
+    "rw_context_tokens_saved",
+    "Context tokens removed by budgeting, per request",
+    buckets=TOKEN_BUCKETS
+)
+
+class ContextTooLarge(ValueError):
+    """Raised when the code a request modifies does not fit the target budget"""
+
+    def __init__(self, tokens: int, budget: int):
+        super().__init__(f"Code to modify is {tokens} tokens, over the {budget} token limit; "
+                         "split the file first")
+        self.tokens = tokens
+        self.budget = budget
+
+_encoding = tiktoken.get_encoding("cl100k_base") if tiktoken else None
+
+def count_tokens(text: str, model: str = None) -> int:
+    """Token count for `text`; ~4 characters per token when tiktoken is missing"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+def looks_like_code(text: str) -> bool:
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return False
+    return any(isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Import, ast.ImportFrom))
+               for node in tree.body)
+
+def code_diff(old: str, new: str) -> str:
+    """Unified diff taking `old` code to `new` code"""
+    return "\n".join(difflib.unified_diff(
+        old.splitlines(), new.splitlines(), "previous", "current", lineterm="", n=1
+    ))
+
+def outline_code(code: str) -> str:
+    """Keep imports, signatures and docstrings; elide function bodies"""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return code
+    lines = code.splitlines()
+    elided = set()
+    # Module and class level defs only: anything nested sits inside a body that is elided anyway
+    nodes = list(tree.body)
+    for node in nodes:
+        if isinstance(node, ast.ClassDef):
+            nodes.extend(node.body)
+            continue
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) or not node.body:
+            continue
+        body = node.body
+        if isinstance(body[0], ast.Expr) and isinstance(getattr(body[0], "value", None), ast.Constant) \
+                and isinstance(body[0].value.value, str):
+            body = body[1:]  # Keep the docstring
+        if body and body[0].lineno > node.lineno:  # One-line defs have nothing to elide
+            elided.update(range(body[0].lineno - 1, body[-1].end_lineno))
+            indent = " " * body[0].col_offset
+            lines[body[0].lineno - 1] = f"{indent}...  # body elided"
+            elided.discard(body[0].lineno - 1)
+    return "\n".join(line for i, line in enumerate(lines) if i not in elided)
+
+def summarize_message(content: str, max_chars: int = 200) -> str:
+    """Short extractive summary: the outline for code, the leading text otherwise"""
+    if looks_like_code(content):
+        signatures = [line.strip() for line in content.splitlines()
+                      if line.lstrip().startswith(("def ", "async def ", "class "))]
+        if signatures:
+            return "[code: " + "; ".join(signatures)[:max_chars] + "]"
+    text = " ".join(content.split())
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + "..."
+
+class ContextBuilder:
+    """Fits thread history and file context into a token budget.
+
+    The latest assistant code is what the next answer modifies, so it is
+    always sent whole; past `target_budget` the request is rejected rather
+    than the model being shown elided bodies it would copy back. Older
+    versions of code are sent as a unified diff to the latest version when
+    that is smaller. Other turns are then kept newest first; one that does
+    not fit is outlined (code) or summarized, and once even that does not fit
+    the remaining older turns are dropped.
+    """
+
+    def __init__(self, budget: int = None, summary_chars: int = None, target_budget: int = None):
+        self.budget = budget or int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+        self.target_budget = target_budget or int(os.getenv("CONTEXT_TARGET_TOKEN_BUDGET", "8000"))
+        self.summary_chars = summary_chars or int(os.getenv("CONTEXT_SUMMARY_CHARS", "200"))
+
+    def _record(self, raw: int, sent: int):
+        CONTEXT_TOKENS.inc(raw, kind="raw")
+        CONTEXT_TOKENS.inc(sent, kind="sent")
+        CONTEXT_TOKENS_SAVED.observe(raw - sent)
+
+    def _check_target(self, code: str, model: str = None) -> int:
+        tokens = count_tokens(code, model)
+        if tokens > self.target_budget:
+            logger.warning(f"Rejected {tokens} token edit target (limit {self.target_budget})")
+            raise ContextTooLarge(tokens, self.target_budget)
+        return tokens
+
+    def fit_target(self, code: str, model: str = None) -> str:
+        """Return the code a request modifies unchanged, raising ContextTooLarge past `target_budget`"""
+        if not code:
+            return code
+        tokens = self._check_target(code, model)
+        self._record(tokens, tokens)
+        return code
+
+    def build_history(self, messages: list, model: str = None, budget: int = None) -> str:
+        """Render LangChain messages, oldest first, within the token budget"""
+        if not messages:
+            return ""
+        budget = budget or self.budget
+        entries = [(msg.type.capitalize(), msg.content) for msg in messages]
+        raw = count_tokens("\n".join(f"{role}: {content}" for role, content in entries), model)
+
+        # The latest code is sent whole; older versions it replaces are sent as diffs
+        code_turns = [i for i, (role, content) in enumerate(entries) if role == "Ai" and looks_like_code(content)]
+        rendered = [f"{role}: {content}" for role, content in entries]
+        target, used = None, 0
+        if code_turns:
+            target = code_turns[-1]
+            latest_code = entries[target][1]
+            self._check_target(latest_code, model)
+            used = count_tokens(rendered[target], model)
+            for index in code_turns[:-1]:
+                diff = code_diff(entries[index][1], latest_code)
+                if count_tokens(diff, model) < count_tokens(entries[index][1], model):
+                    rendered[index] = f"Ai: [earlier version, shown as a diff to the latest code]\n{diff}"
+
+        # Newest first: keep whole turns, then outlines or summaries, then drop the rest
+        kept = []
+        for index in range(len(rendered) - 1, -1, -1):
+            if index == target:
+                kept.append(rendered[index])  # Already counted in `used`
+                continue
+            role, content = entries[index]
+            candidates = [rendered[index]]
+            if looks_like_code(content):
+                candidates.append(f"{role}: {outline_code(content)}")
+            candidates.append(f"{role}: {summarize_message(content, self.summary_chars)}")
+
+            fitting = [(line, count_tokens(line, model)) for line in candidates]
+            choice = next(((line, tokens) for line, tokens in fitting if used + tokens <= budget), None)
+            if choice is None:
+                if target is not None and index > target and kept:
+                    continue  # Drop this turn but keep walking back to the code being modified
+                if kept:
+                    break
+                choice = fitting[-1]  # The newest turn is always represented
+            kept.append(choice[0])
+            used += choice[1]
+
+        context = "\n".join(reversed(kept))
+        self._record(raw, min(raw, used))
+        return context
@@ -1,29 +1,68 @@
 # services/llm_middleware.py
 from abc import ABC, abstractmethod
 import os
+import time
 import uuid
 import logging
-from elasticsearch import Elasticsearch, BadRequestError
+from elasticsearch import BadRequestError
+from utils.http_pool import shared_elasticsearch
 from datetime import datetime
 from langchain.memory import ConversationBufferMemory
-from langchain_community.chat_message_histories import ElasticsearchChatMessageHistory
+from services.chat_history import ChatHistoryStore
+from services.write_behind import BulkWriter
+from services.response_cache import ResponseCache
+from services.single_flight import SingleFlight, flight_key
+from services.context_builder import ContextBuilder, ContextTooLarge, looks_like_code
+from utils import tracing
+from services.llm_scheduler import QueueTimeout, default_scheduler, estimate_tokens
 from langchain_anthropic import ChatAnthropic
 from langchain_core.prompts import ChatPromptTemplate
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = """
+                You are a Python code generator. Return ONLY valid Python code.
+                DO NOT include:
+                - Markdown formatting (no ``````)
+                - Comments or explanations
+                - Example usage
+                If unclear, return exactly:
+                # I do not understand the request please provide information to generate python code
+                """
+
+CHAT_HISTORY_MAPPING = {
+    "mappings": {
+        "properties": {
+            "session_id": {"type": "keyword"},
+            "type": {"type": "keyword"},  # 'human' or 'ai'
+            "content": {"type": "text"},
+            "created_at": {"type": "date"},  # Required by LangChain
+            "timestamp": {"type": "date"}    # Your existing field
+        }
+    }
+}
+
 class LLMMiddleware:
-    def __init__(self):
+    def __init__(self, provider=None):
         self.client = ChatAnthropic(
             model="claude-3-5-sonnet-20240620",
             temperature=0.0,
             max_tokens=4000,
             anthropic_api_key=os.getenv("ANTHROPIC_API_KEY")
         )
-        self.es = Elasticsearch(os.getenv("ELASTICSEARCH_URL"))
+        self.es = shared_elasticsearch()  # One connection pool for every middleware
         self.index_name = "chat_history"
         self._initialize_elasticsearch()
+        self.writer = BulkWriter(self.es)  # Chat messages are indexed off the response path
+        self.cache = ResponseCache()
+        self.flights = SingleFlight()  # Identical concurrent prompts share one upstream call
+        self.context_builder = ContextBuilder()  # Keeps thread context within CONTEXT_TOKEN_BUDGET
+        self.scheduler = default_scheduler()  # Provider rate limits and fair queueing
+        self.output_token_estimate = int(os.getenv("LLM_OUTPUT_TOKEN_ESTIMATE", "1000"))
+        self.history = ChatHistoryStore(self.es, self.index_name, turns=3, writer=self.writer)  # Last 3 exchanges
+        self.chain = self._build_chain()  # Built once, reused by every request
+        self.provider = provider  # Optional LLMProvider (e.g. LLMRouter) for non-streamed calls
 
     def _initialize_elasticsearch(self):
         """Create Elasticsearch index with LangChain-compatible mapping"""
@@ -31,17 +70,7 @@ class LLMMiddleware:
             if not self.es.indices.exists(index=self.index_name):
                 self.es.indices.create(
                     index=self.index_name,
-                    body={
-                        "mappings": {
-                            "properties": {
-                                "session_id": {"type": "keyword"},
-                                "type": {"type": "keyword"},  # 'human' or 'ai'
-                                "content": {"type": "text"},
-                                "created_at": {"type": "date"},  # Required by LangChain
-                                "timestamp": {"type": "date"}    # Your existing field
-                            }
-                        }
-                    }
+                    body=CHAT_HISTORY_MAPPING
                 )
                 logger.info("Created new Elasticsearch index with correct mapping")
         except Exception as e:
@@ -51,73 +80,151 @@ class LLMMiddleware:
     def _get_message_history(self, thread_id):
         """Get LangChain message history with proper error handling"""
         try:
-            return ElasticsearchChatMessageHistory(
-                index=self.index_name,
-                session_id=thread_id,
-                es_connection=self.es
-            )
+            return self.history.thread(thread_id)
         except Exception as e:
             logger.error(f"Message history error: {str(e)}")
             raise
 
+    def latest_code(self, thread_id: str) -> str:
+        """The thread's most recent answer that is code, or None; edit mode patches it"""
+        for message in reversed(self._get_message_history(thread_id).messages):
+            if message.type == "ai" and looks_like_code(message.content):
+                return message.content
+        return None
+
+    def record_exchange(self, thread_id: str, prompt: str, response: str):
+        """Append a prompt and answer produced elsewhere (edit mode) to the thread"""
+        self._get_message_history(thread_id).add_exchange(prompt, response)
+
+    def _prepare_thread(self, prompt: str, thread_id: str = None, new_thread: bool = False) -> tuple:
+        """Resolve the thread, load its history and build the augmented prompt"""
+        if new_thread or not thread_id:
+            thread_id = str(uuid.uuid4())
+            logger.info(f"Starting new thread: {thread_id}")
+
+        # Initialize message history
+        message_history = self._get_message_history(thread_id)
+
+        # Clear history if new thread
+        if new_thread:
+            message_history.clear()
+            logger.debug(f"Cleared history for new thread: {thread_id}")
+
+        # Build context from previous messages, within the token budget
+        context = self.context_builder.build_history(message_history.messages)
+
+        # Create augmented prompt
+        augmented_prompt = f"Context:\n{context}\n\nNew Query: {prompt}" if context else prompt
+        return thread_id, message_history, context, augmented_prompt
+
     def generate_response(self, prompt: str, model: str = "claude-3-5-sonnet-20240620", **kwargs) -> tuple:
         try:
-            # Thread management
-            thread_id = kwargs.get("thread_id")
-            new_thread = kwargs.get("new_thread", False)
-            
-            if new_thread or not thread_id:
-                thread_id = str(uuid.uuid4())
-                logger.info(f"Starting new thread: {thread_id}")
+            with tracing.span("history_read"):
+                thread_id, message_history, context, augmented_prompt = self._prepare_thread(
+                    prompt,
+                    thread_id=kwargs.get("thread_id"),
+                    new_thread=kwargs.get("new_thread", False)
+                )
 
-            # Initialize message history
-            message_history = self._get_message_history(thread_id)
-            
-            # Clear history if new thread
-            if new_thread:
-                message_history.clear()
-                logger.debug(f"Cleared history for new thread: {thread_id}")
-
-            # Build context from previous messages
-            context = "\n".join(
-                f"{msg.type.capitalize()}: {msg.content}"
-                for msg in message_history.messages[-3:]  # Last 3 exchanges
-            )
+            # Generate response, reusing a cached answer for a repeated prompt
+            user, use_cache = kwargs.get("user"), kwargs.get("use_cache", True)
+            cache_model = model if self.provider else self.client.model
+            tracing.tag(model=cache_model, provider=self.provider.name if self.provider else "anthropic")
+            with tracing.span("cache"):
+                response = self.cache.lookup(prompt, context, cache_model, user=user, use_cache=use_cache)
+            if response is None:
+                def call():
+                    started = time.perf_counter()
+                    result = self._call_provider(augmented_prompt, model, user, kwargs.get("priority", "interactive"))
+                    self.cache.store(prompt, context, cache_model, result, latency=time.perf_counter() - started,
+                                     user=user, use_cache=use_cache)
+                    return result
 
-            # Create augmented prompt
-            augmented_prompt = f"Context:\n{context}\n\nNew Query: {prompt}" if context else prompt
-            
-            # Generate response
-            response = self._call_anthropic(augmented_prompt)
+                # Users who opted out of caching never share another request's result
+                response = call() if self.cache.bypass(user, use_cache) else \
+                    self.flights.do(flight_key(cache_model, prompt, context), call)
             
             # Store interaction
-            message_history.add_user_message(prompt)
-            message_history.add_ai_message(response)
+            with tracing.span("history_write"):
+                message_history.add_exchange(prompt, response)
             
             return response, thread_id
 
+        except QueueTimeout:
+            raise  # Surfaced as 503 so clients back off and retry
+        except ContextTooLarge as e:
+            return f"# Error: {e}", "error"
         except Exception as e:
             logger.error(f"Request failed: {str(e)}", exc_info=True)
             return "# Error processing request", "error"
 
+    def _slot(self, prompt: str, user: str = None, priority: str = "interactive", provider: str = "anthropic"):
+        """Wait for a rate-limited slot on a provider this middleware calls directly"""
+        return self.scheduler.slot(
+            provider,
+            user=user,
+            priority=priority,
+            tokens=estimate_tokens(prompt) + self.output_token_estimate
+        )
+
+    def stream_response(self, prompt: str, model: str = "claude-3-5-sonnet-20240620", **kwargs) -> tuple:
+        """Start a streamed generation, returning (thread_id, chunk iterator)"""
+        with tracing.span("history_read"):
+            thread_id, message_history, context, augmented_prompt = self._prepare_thread(
+                prompt,
+                thread_id=kwargs.get("thread_id"),
+                new_thread=kwargs.get("new_thread", False)
+            )
+
+        def chunks():
+            # History is only written once the stream completes, so an aborted
+            # stream never leaves a half-written answer in the thread
+            user, use_cache = kwargs.get("user"), kwargs.get("use_cache", True)
+            cached = self.cache.lookup(prompt, context, self.client.model, user=user, use_cache=use_cache)
+            if cached is not None:
+                yield cached
+                message_history.add_exchange(prompt, cached)
+                return
+
+            parts = []
+            with self._slot(augmented_prompt, user, kwargs.get("priority", "interactive")):
+                started = time.perf_counter()
+                for chunk in self._stream_anthropic(augmented_prompt):
+                    if not parts:
+                        tracing.record("llm_first_token", time.perf_counter() - started, model=self.client.model, provider="anthropic")
+                    parts.append(chunk)
+                    yield chunk
+                tracing.record("llm_stream", time.perf_counter() - started, model=self.client.model, provider="anthropic")
+
+            response = "".join(parts).replace('``````', '').strip()
+            self.cache.store(prompt, context, self.client.model, response, latency=time.perf_counter() - started,
+                             user=user, use_cache=use_cache)
+            message_history.add_exchange(prompt, response)
+
+        return thread_id, chunks()
+
+    def _call_provider(self, prompt: str, model: str, user: str = None, priority: str = "interactive") -> str:
+        """Send the prompt through the configured provider, or straight to Anthropic, within a scheduler slot"""
+        if self.provider is None:
+            with self._slot(prompt, user, priority), tracing.span("llm"):
+                return self._call_anthropic(prompt)
+        try:
+            if getattr(self.provider, "schedules_calls", False):
+                # A router takes the slot on whichever backend it picks
+                with tracing.span("llm"):
+                    return self.provider.generate_response(prompt, model, user=user, priority=priority)
+            with self._slot(prompt, user, priority, self.provider.name), tracing.span("llm"):
+                return self.provider.generate_response(prompt, model)
+        except QueueTimeout:
+            raise
+        except Exception as e:
+            logger.error(f"Provider failure: {str(e)}")
+            return "# Error generating response"
+
     def _call_anthropic(self, prompt: str) -> str:
         """Execute Anthropic API call with strict code-only output"""
         try:
-            prompt_template = ChatPromptTemplate.from_messages([
-                ("system", """
-                You are a Python code generator. Return ONLY valid Python code.
-                DO NOT include:
-                - Markdown formatting (no ``````)
-                - Comments or explanations
-                - Example usage
-                If unclear, return exactly:
-                # I do not understand the request please provide information to generate python code
-                """),
-                ("human", "{input}")
-            ])
-            
-            chain = prompt_template | self.client
-            result = chain.invoke({"input": prompt})
+            result = self.chain.invoke({"input": prompt})
             
             response = result.content.strip()
             
@@ -128,3 +235,17 @@ class LLMMiddleware:
             logger.error(f"Anthropic API failure: {str(e)}")
             return "# Error generating response"
 
+    def _stream_anthropic(self, prompt: str):
+        """Yield Anthropic completion tokens as they arrive"""
+        for chunk in self.chain.stream({"input": prompt}):
+            if chunk.content:
+                yield chunk.content
+
+    def _build_chain(self):
+        """Build the code-only prompt chain for the Anthropic client"""
+        prompt_template = ChatPromptTemplate.from_messages([
+            ("system", SYSTEM_PROMPT),
+            ("human", "{input}")
+        ])
+        return prompt_template | self.client
+
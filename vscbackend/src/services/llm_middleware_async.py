@@ -0,0 +1,196 @@
+# services/llm_middleware_async.py
+import os
+import json
+import time
+import uuid
+import logging
+from utils.http_pool import async_elasticsearch
+from langchain_anthropic import ChatAnthropic
+from langchain_core.messages import HumanMessage, AIMessage, message_to_dict, messages_from_dict
+from langchain_core.prompts import ChatPromptTemplate
+from services.llm_middleware import SYSTEM_PROMPT, CHAT_HISTORY_MAPPING
+from services.response_cache import ResponseCache
+from services.single_flight import AsyncSingleFlight, flight_key
+from services.context_builder import ContextBuilder, ContextTooLarge
+from services.llm_scheduler import QueueTimeout, default_scheduler, estimate_tokens
+from utils import tracing
+
+logger = logging.getLogger(__name__)
+
+class AsyncLLMMiddleware:
+    """asyncio counterpart of LLMMiddleware for the ASGI server.
+
+    Reads and writes the same LangChain-compatible `chat_history` documents, so
+    threads can move freely between the threaded and ASGI serving modes.
+    """
+
+    def __init__(self):
+        self.client = ChatAnthropic(
+            model="claude-3-5-sonnet-20240620",
+            temperature=0.0,
+            max_tokens=4000,
+            anthropic_api_key=os.getenv("ANTHROPIC_API_KEY")
+        )
+        self.es = async_elasticsearch()
+        self.index_name = "chat_history"
+        self.history_turns = 3
+        self.chain = ChatPromptTemplate.from_messages([
+            ("system", SYSTEM_PROMPT),
+            ("human", "{input}")
+        ]) | self.client
+        self.cache = ResponseCache()  # Repeated prompts skip the provider entirely
+        self.flights = AsyncSingleFlight()  # Identical concurrent prompts share one upstream call
+        self.context_builder = ContextBuilder()  # Keeps thread context within CONTEXT_TOKEN_BUDGET
+        self.scheduler = default_scheduler()  # Same provider limits and fair queue as the threaded server
+        self.output_token_estimate = int(os.getenv("LLM_OUTPUT_TOKEN_ESTIMATE", "1000"))
+
+    async def initialize(self):
+        """Create Elasticsearch index with LangChain-compatible mapping"""
+        try:
+            if not await self.es.indices.exists(index=self.index_name):
+                await self.es.indices.create(index=self.index_name, body=CHAT_HISTORY_MAPPING)
+                logger.info("Created new Elasticsearch index with correct mapping")
+        except Exception as e:
+            logger.error(f"Elasticsearch initialization failed: {str(e)}")
+            raise
+
+    async def close(self):
+        """Release the Elasticsearch connection pool"""
+        await self.es.close()
+
+    async def _recent_messages(self, thread_id: str) -> list:
+        """Fetch the last few messages of a thread, oldest first"""
+        result = await self.es.search(
+            index=self.index_name,
+            query={"term": {"session_id": thread_id}},
+            sort="created_at:desc",
+            size=self.history_turns
+        )
+        documents = [json.loads(hit["_source"]["history"]) for hit in result["hits"]["hits"]]
+        return messages_from_dict(list(reversed(documents)))
+
+    async def _store_messages(self, thread_id: str, messages: list):
+        """Append messages to a thread in LangChain's document format"""
+        created_at = round(time.time() * 1000)
+        for offset, message in enumerate(messages):
+            await self.es.index(
+                index=self.index_name,
+                document={
+                    "session_id": thread_id,
+                    "created_at": created_at + offset,  # Keep user/ai ordering stable
+                    "history": json.dumps(message_to_dict(message))
+                },
+                refresh=True
+            )
+
+    async def _clear_thread(self, thread_id: str):
+        """Delete every message stored for a thread"""
+        await self.es.delete_by_query(
+            index=self.index_name,
+            query={"term": {"session_id": thread_id}},
+            refresh=True
+        )
+
+    async def _prepare_thread(self, prompt: str, thread_id: str = None, new_thread: bool = False) -> tuple:
+        """Resolve the thread and build its context and the augmented prompt"""
+        if new_thread or not thread_id:
+            thread_id = str(uuid.uuid4())
+            logger.info(f"Starting new thread: {thread_id}")
+
+        if new_thread:
+            await self._clear_thread(thread_id)
+            context = ""
+        else:
+            context = self.context_builder.build_history(await self._recent_messages(thread_id))
+
+        augmented_prompt = f"Context:\n{context}\n\nNew Query: {prompt}" if context else prompt
+        return thread_id, context, augmented_prompt
+
+    async def generate_response(self, prompt: str, model: str = "claude-3-5-sonnet-20240620", **kwargs) -> tuple:
+        try:
+            tracing.tag(model=self.client.model, provider="anthropic")
+            with tracing.span("history_read"):
+                thread_id, context, augmented_prompt = await self._prepare_thread(
+                    prompt,
+                    thread_id=kwargs.get("thread_id"),
+                    new_thread=kwargs.get("new_thread", False)
+                )
+
+            # Generate response, reusing a cached answer for a repeated prompt
+            user, use_cache = kwargs.get("user"), kwargs.get("use_cache", True)
+            with tracing.span("cache"):
+                response = self.cache.lookup(prompt, context, self.client.model, user=user, use_cache=use_cache)
+            if response is None:
+                async def call():
+                    started = time.perf_counter()
+                    with tracing.span("llm"):
+                        result = await self._call_anthropic(augmented_prompt, user, kwargs.get("priority", "interactive"))
+                    self.cache.store(prompt, context, self.client.model, result, latency=time.perf_counter() - started,
+                                     user=user, use_cache=use_cache)
+                    return result
+
+                # Users who opted out of caching never share another request's result
+                response = await call() if self.cache.bypass(user, use_cache) else \
+                    await self.flights.do(flight_key(self.client.model, prompt, context), call)
+
+            with tracing.span("history_write"):
+                await self._store_messages(thread_id, [HumanMessage(content=prompt), AIMessage(content=response)])
+            return response, thread_id
+
+        except QueueTimeout:
+            raise
+        except ContextTooLarge as e:
+            return f"# Error: {e}", "error"
+        except Exception as e:
+            logger.error(f"Request failed: {str(e)}", exc_info=True)
+            return "# Error processing request", "error"
+
+    async def stream_response(self, prompt: str, model: str = "claude-3-5-sonnet-20240620", **kwargs) -> tuple:
+        """Start a streamed generation, returning (thread_id, async chunk iterator)"""
+        thread_id, context, augmented_prompt = await self._prepare_thread(
+            prompt,
+            thread_id=kwargs.get("thread_id"),
+            new_thread=kwargs.get("new_thread", False)
+        )
+
+        async def chunks():
+            user, use_cache = kwargs.get("user"), kwargs.get("use_cache", True)
+            cached = self.cache.lookup(prompt, context, self.client.model, user=user, use_cache=use_cache)
+            if cached is not None:
+                yield cached
+                await self._store_messages(thread_id, [HumanMessage(content=prompt), AIMessage(content=cached)])
+                return
+
+            parts = []
+            async with self._slot(augmented_prompt, user, kwargs.get("priority", "interactive")):
+                started = time.perf_counter()
+                async for chunk in self.chain.astream({"input": augmented_prompt}):
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield chunk.content
+
+            response = "".join(parts).replace('``````', '').strip()
+            self.cache.store(prompt, context, self.client.model, response, latency=time.perf_counter() - started,
+                             user=user, use_cache=use_cache)
+            await self._store_messages(thread_id, [HumanMessage(content=prompt), AIMessage(content=response)])
+
+        return thread_id, chunks()
+
+    def _slot(self, prompt: str, user: str = None, priority: str = "interactive"):
+        """Wait, without blocking the event loop, for a rate-limited Anthropic slot"""
+        return self.scheduler.async_slot(
+            "anthropic",
+            user=user,
+            priority=priority,
+            tokens=estimate_tokens(prompt) + self.output_token_estimate
+        )
+
+    async def _call_anthropic(self, prompt: str, user: str = None, priority: str = "interactive") -> str:
+        """Execute Anthropic API call with strict code-only output"""
+        async with self._slot(prompt, user, priority):
+            try:
+                result = await self.chain.ainvoke({"input": prompt})
+                return result.content.strip().replace('``````', '').strip()
+            except Exception as e:
+                logger.error(f"Anthropic API failure: {str(e)}")
+                return "# Error generating response"
@@ -2,22 +2,50 @@
 from abc import ABC, abstractmethod
 from groq import Groq
 import os
+import time
 import uuid
 import logging
-from elasticsearch import Elasticsearch, BadRequestError
+from elasticsearch import BadRequestError
+from utils.http_pool import shared_elasticsearch, shared_httpx_client
 from datetime import datetime
 from langchain.memory import ConversationBufferMemory
-from langchain_community.chat_message_histories import ElasticsearchChatMessageHistory
+from services.chat_history import ChatHistoryStore
+from services.write_behind import BulkWriter
+from services.response_cache import ResponseCache
+from services.single_flight import SingleFlight, flight_key
+from services.context_builder import ContextBuilder, ContextTooLarge
+from utils import tracing
+from services.llm_scheduler import QueueTimeout, default_scheduler, estimate_tokens
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": (
+        "You are a Python code generator. Return ONLY valid Python code.\n"
+        "DO NOT include:\n"
+        "- Markdown formatting (no ``````)\n"
+        "- Comments or explanations\n"
+        "- Example usage\n"
+        "If unclear, return exactly:\n"
+        "# I do not understand the request please provide information to generate python code"
+    )
+}
+
 class LLMMiddleware:
     def __init__(self):
-        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        self.es = Elasticsearch(os.getenv("ELASTICSEARCH_URL"))
+        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"), http_client=shared_httpx_client())
+        self.es = shared_elasticsearch()  # One connection pool for every middleware
         self.index_name = "chat_history"
         self._initialize_elasticsearch()
+        self.writer = BulkWriter(self.es)  # Chat messages are indexed off the response path
+        self.cache = ResponseCache()
+        self.flights = SingleFlight()  # Identical concurrent prompts share one upstream call
+        self.context_builder = ContextBuilder()  # Keeps thread context within CONTEXT_TOKEN_BUDGET
+        self.scheduler = default_scheduler()  # Provider rate limits and fair queueing
+        self.output_token_estimate = int(os.getenv("LLM_OUTPUT_TOKEN_ESTIMATE", "1000"))
+        self.history = ChatHistoryStore(self.es, self.index_name, turns=3, writer=self.writer)  # Last 3 exchanges
 
     def _initialize_elasticsearch(self):
         """Create Elasticsearch index with LangChain-compatible mapping"""
@@ -45,74 +73,124 @@ class LLMMiddleware:
     def _get_message_history(self, thread_id):
         """Get LangChain message history with proper error handling"""
         try:
-            return ElasticsearchChatMessageHistory(
-                index=self.index_name,
-                session_id=thread_id,
-                es_connection=self.es
-            )
+            return self.history.thread(thread_id)
         except Exception as e:
             logger.error(f"Message history error: {str(e)}")
             raise
 
+    def _prepare_thread(self, prompt: str, thread_id: str = None, new_thread: bool = False) -> tuple:
+        """Resolve the thread, load its history and build the augmented prompt"""
+        if new_thread or not thread_id:
+            thread_id = str(uuid.uuid4())
+            logger.info(f"Starting new thread: {thread_id}")
+
+        # Initialize message history
+        message_history = self._get_message_history(thread_id)
+
+        # Clear history if new thread
+        if new_thread:
+            message_history.clear()
+            logger.debug(f"Cleared history for new thread: {thread_id}")
+
+        # Build context from previous messages, within the token budget
+        context = self.context_builder.build_history(message_history.messages)
+
+        # Create augmented prompt
+        augmented_prompt = f"Context:\n{context}\n\nNew Query: {prompt}" if context else prompt
+        return thread_id, message_history, context, augmented_prompt
+
     def generate_response(self, prompt: str, model: str = "llama3-70b-8192", **kwargs) -> tuple:
         try:
-            # Thread management
-            thread_id = kwargs.get("thread_id")
-            new_thread = kwargs.get("new_thread", False)
-            
-            if new_thread or not thread_id:
-                thread_id = str(uuid.uuid4())
-                logger.info(f"Starting new thread: {thread_id}")
+            with tracing.span("history_read"):
+                thread_id, message_history, context, augmented_prompt = self._prepare_thread(
+                    prompt,
+                    thread_id=kwargs.get("thread_id"),
+                    new_thread=kwargs.get("new_thread", False)
+                )
 
-            # Initialize message history
-            message_history = self._get_message_history(thread_id)
-            
-            # Clear history if new thread
-            if new_thread:
-                message_history.clear()
-                logger.debug(f"Cleared history for new thread: {thread_id}")
-
-            # Build context from previous messages
-            context = "\n".join(
-                f"{msg.type.capitalize()}: {msg.content}"
-                for msg in message_history.messages[-3:]  # Last 3 exchanges
-            )
+            # Generate response, reusing a cached answer for a repeated prompt
+            user, use_cache = kwargs.get("user"), kwargs.get("use_cache", True)
+            tracing.tag(model=model, provider="groq")
+            with tracing.span("cache"):
+                response = self.cache.lookup(prompt, context, model, user=user, use_cache=use_cache)
+            if response is None:
+                def call():
+                    with self._slot(augmented_prompt, user, kwargs.get("priority", "interactive")):
+                        started = time.perf_counter()
+                        with tracing.span("llm"):
+                            result = self._call_groq(augmented_prompt, model)
+                    self.cache.store(prompt, context, model, result, latency=time.perf_counter() - started,
+                                     user=user, use_cache=use_cache)
+                    return result
 
-            # Create augmented prompt
-            augmented_prompt = f"Context:\n{context}\n\nNew Query: {prompt}" if context else prompt
-            
-            # Generate response
-            response = self._call_groq(augmented_prompt, model)
+                # Users who opted out of caching never share another request's result
+                response = call() if self.cache.bypass(user, use_cache) else \
+                    self.flights.do(flight_key(model, prompt, context), call)
             
             # Store interaction
-            message_history.add_user_message(prompt)
-            message_history.add_ai_message(response)
+            with tracing.span("history_write"):
+                message_history.add_exchange(prompt, response)
             
             return response, thread_id
 
+        except QueueTimeout:
+            raise  # Surfaced as 503 so clients back off and retry
+        except ContextTooLarge as e:
+            return f"# Error: {e}", "error"
         except Exception as e:
             logger.error(f"Request failed: {str(e)}", exc_info=True)
             return "# Error processing request", "error"
 
+    def _slot(self, prompt: str, user: str = None, priority: str = "interactive"):
+        """Wait for a rate-limited slot on Groq"""
+        return self.scheduler.slot(
+            "groq",
+            user=user,
+            priority=priority,
+            tokens=estimate_tokens(prompt) + self.output_token_estimate
+        )
+
+    def stream_response(self, prompt: str, model: str = "llama3-70b-8192", **kwargs) -> tuple:
+        """Start a streamed generation, returning (thread_id, chunk iterator)"""
+        with tracing.span("history_read"):
+            thread_id, message_history, context, augmented_prompt = self._prepare_thread(
+                prompt,
+                thread_id=kwargs.get("thread_id"),
+                new_thread=kwargs.get("new_thread", False)
+            )
+
+        def chunks():
+            # History is only written once the stream completes, so an aborted
+            # stream never leaves a half-written answer in the thread
+            user, use_cache = kwargs.get("user"), kwargs.get("use_cache", True)
+            cached = self.cache.lookup(prompt, context, model, user=user, use_cache=use_cache)
+            if cached is not None:
+                yield cached
+                message_history.add_exchange(prompt, cached)
+                return
+
+            parts = []
+            with self._slot(augmented_prompt, user, kwargs.get("priority", "interactive")):
+                started = time.perf_counter()
+                for chunk in self._stream_groq(augmented_prompt, model):
+                    if not parts:
+                        tracing.record("llm_first_token", time.perf_counter() - started, model=model, provider="groq")
+                    parts.append(chunk)
+                    yield chunk
+                tracing.record("llm_stream", time.perf_counter() - started, model=model, provider="groq")
+
+            response = "".join(parts).replace('``````', '').strip()
+            self.cache.store(prompt, context, model, response, latency=time.perf_counter() - started,
+                             user=user, use_cache=use_cache)
+            message_history.add_exchange(prompt, response)
+
+        return thread_id, chunks()
+
     def _call_groq(self, prompt: str, model: str) -> str:
         """Execute Groq API call with strict code-only output"""
         try:
             completion = self.client.chat.completions.create(
-                messages=[{
-                    "role": "system",
-                    "content": (
-                        "You are a Python code generator. Return ONLY valid Python code.\n"
-                        "DO NOT include:\n"
-                        "- Markdown formatting (no ``````)\n"
-                        "- Comments or explanations\n"
-                        "- Example usage\n"
-                        "If unclear, return exactly:\n"
-                        "# I do not understand the request please provide information to generate python code"
-                    )
-                }, {
-                    "role": "user",
-                    "content": prompt
-                }],
+                messages=self._build_messages(prompt),
                 model=model,
                 temperature=0.0  # Fully deterministic
             )
@@ -125,3 +203,19 @@ class LLMMiddleware:
             logger.error(f"Groq API failure: {str(e)}")
             return "# Error generating response"
 
+    def _stream_groq(self, prompt: str, model: str):
+        """Yield Groq completion tokens as they arrive"""
+        stream = self.client.chat.completions.create(
+            messages=self._build_messages(prompt),
+            model=model,
+            temperature=0.0,
+            stream=True
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
+    def _build_messages(self, prompt: str) -> list:
+        """Build the code-only chat messages for the Groq client"""
+        return [SYSTEM_MESSAGE, {"role": "user", "content": prompt}]
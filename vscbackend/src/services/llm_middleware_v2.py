@@ -3,21 +3,42 @@ import os
 import uuid
 import logging
 import re
-from elasticsearch import Elasticsearch
+import time
+import threading
+from utils.http_pool import shared_elasticsearch
 from datetime import datetime
 from typing import Tuple
+from collections import OrderedDict
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_anthropic import ChatAnthropic
 import dotenv
+from services.write_behind import BulkWriter
+from services.context_builder import ContextBuilder, ContextTooLarge, code_diff
+from services.code_patch import PatchError, parse_edit_blocks, apply_edit_blocks
+from services.code_validation import CodeValidator
+from services.llm_scheduler import QueueTimeout, default_scheduler, estimate_tokens
+from utils import tracing
 
 logger = logging.getLogger(__name__)
 
 class LLMMiddlewareV2:
-    def __init__(self):
+    def __init__(self, validator: CodeValidator = None):
+        # Built first: the validator forks its worker pool before any client threads start
+        self.validator = validator or CodeValidator()
         self._init_llm()
-        self.es = Elasticsearch(os.getenv("ELASTICSEARCH_URL"))
+        self.es = shared_elasticsearch()  # One connection pool for every middleware
         self.index_name = "chat_history_v2"
         self._ensure_es_index()
+        self.writer = BulkWriter(self.es)  # Chat messages are indexed off the response path
+        # Latest code per session, so the next turn does not depend on the flush
+        self._latest_code = OrderedDict()  # session_id -> (code, stored_at)
+        self._latest_code_limit = int(os.getenv("CHAT_HISTORY_CACHE_THREADS", "1024"))
+        # Bounds staleness when another worker process edits the same session
+        self._latest_code_ttl = float(os.getenv("CHAT_HISTORY_CACHE_TTL", "300"))
+        self._latest_code_lock = threading.Lock()
+        self.context_builder = ContextBuilder()  # Rejects code over CONTEXT_TARGET_TOKEN_BUDGET
+        self.scheduler = default_scheduler()  # Shares the anthropic rate limits with LLMMiddleware
+        self.output_token_estimate = int(os.getenv("LLM_OUTPUT_TOKEN_ESTIMATE", "1000"))
 
     def _init_llm(self):
         """Initialize Claude 3.5 Sonnet with focused instructions"""
@@ -38,6 +59,28 @@ You are a Python code maintenance expert. Follow these rules:
 [Existing Code]
 {context}
 
+[New Requirement]
+{input}
+""")
+        self.edit_template = ChatPromptTemplate.from_template("""
+[System]
+You are a Python code maintenance expert. Change the existing code below to
+implement the new requirement. DO NOT return the whole file. Return ONLY edit
+blocks in exactly this format, one per change, with no other text:
+
+<<<<<<< SEARCH
+lines copied exactly from the existing code
+=======
+the lines that replace them
+>>>>>>> REPLACE
+
+Each SEARCH section must match the existing code exactly once; include enough
+surrounding lines to make it unique. Keep the original function names and
+parameters, and use 4-space indentation.
+
+[Existing Code]
+{context}
+
 [New Requirement]
 {input}
 """)
@@ -66,6 +109,13 @@ You are a Python code maintenance expert. Follow these rules:
 
     def _get_conversation_context(self, session_id: str) -> str:
         """Retrieve latest valid code from the session"""
+        with self._latest_code_lock:
+            entry = self._latest_code.get(session_id)
+            if entry is not None and time.monotonic() - entry[1] <= self._latest_code_ttl:
+                self._latest_code.move_to_end(session_id)
+                return entry[0]
+            if entry is not None:
+                del self._latest_code[session_id]
         try:
             response = self.es.search(
                 index=self.index_name,
@@ -91,10 +141,16 @@ You are a Python code maintenance expert. Follow these rules:
 
     def _store_message(self, session_id: str, role: str, content: str):
         """Store message with validation"""
+        if role == "assistant":
+            with self._latest_code_lock:
+                self._latest_code[session_id] = (content.strip(), time.monotonic())
+                self._latest_code.move_to_end(session_id)
+                while len(self._latest_code) > self._latest_code_limit:
+                    self._latest_code.popitem(last=False)
         try:
-            self.es.index(
-                index=self.index_name,
-                document={
+            self.writer.add(
+                self.index_name,
+                {
                     "session_id": session_id,
                     "role": role,
                     "content": content.strip(),
@@ -104,16 +160,26 @@ You are a Python code maintenance expert. Follow these rules:
         except Exception as e:
             logger.error("Message storage failed: %s", str(e))
 
-    def generate_response(self, prompt: str, session_id: str = None) -> Tuple[str, str]:
-        """Generate context-aware code response"""
+    def _invoke(self, text: str, user: str = None, priority: str = "interactive", **attributes):
+        """Call the model within an anthropic scheduler slot"""
+        tokens = estimate_tokens(text) + self.output_token_estimate
+        with self.scheduler.slot("anthropic", user=user, priority=priority, tokens=tokens):
+            with tracing.span("llm", **attributes):
+                return self.llm.invoke(text)
+
+    def generate_response(self, prompt: str, session_id: str = None, user: str = None,
+                          priority: str = "interactive", context: str = None) -> Tuple[str, str]:
+        """Generate context-aware code response; `context` overrides the session's stored code"""
         session_id = session_id or str(uuid.uuid4())
         try:
-            context = self._get_conversation_context(session_id)
+            tracing.tag(model=self.llm.model, provider="anthropic")
+            if context is None:
+                with tracing.span("history_read"):
+                    context = self._get_conversation_context(session_id)
             logger.info("Using context:\n%s", context)
+            context = self.context_builder.fit_target(context)
             
-            result = self.llm.invoke(
-                self.prompt_template.format(context=context, input=prompt)
-            )
+            result = self._invoke(self.prompt_template.format(context=context, input=prompt), user, priority)
             
             code = self._sanitize_code(result.content)
             self._validate_code(code, context)
@@ -123,10 +189,62 @@ You are a Python code maintenance expert. Follow these rules:
             
             return code, session_id
 
+        except ContextTooLarge as e:
+            return f"# Error: {e}", session_id
+        except QueueTimeout:
+            raise  # Surfaced as 503 so clients back off and retry
         except Exception as e:
             logger.error("Generation failed: %s", str(e))
             return "# Error: Unable to generate valid code", session_id
 
+    def latest_code(self, session_id: str) -> str:
+        """The session's stored code, or "" when this middleware has none"""
+        return self._get_conversation_context(session_id)
+
+    def generate_edit(self, prompt: str, session_id: str = None, user: str = None,
+                      priority: str = "interactive", base_code: str = None) -> Tuple[str, str, str]:
+        """Generate a patch for the session's code, returning (merged code, unified diff, session id)
+
+        Output tokens scale with the size of the change rather than the file.
+        `base_code` is the code to patch when the caller keeps the thread (the
+        main chat history); otherwise the session's stored code is used.
+        Sessions without code, and edits that do not apply cleanly, fall back
+        to regenerating the whole file.
+        """
+        session_id = session_id or str(uuid.uuid4())
+        tracing.tag(model=self.llm.model, provider="anthropic")
+        if base_code:
+            context = base_code
+        else:
+            with tracing.span("history_read"):
+                context = self._get_conversation_context(session_id)
+        if not context:
+            code, session_id = self.generate_response(prompt, session_id, user, priority)
+            return code, code_diff("", code), session_id
+
+        try:
+            context = self.context_builder.fit_target(context)
+            result = self._invoke(self.edit_template.format(context=context, input=prompt), user, priority,
+                                  mode="edit")
+            code = apply_edit_blocks(context, parse_edit_blocks(result.content))
+            self._validate_code(code, context)
+        except ContextTooLarge as e:
+            return f"# Error: {e}", "", session_id
+        except (PatchError, ValueError) as e:
+            logger.warning("Edit mode fell back to full regeneration: %s", str(e))
+            # Regenerate from the code being edited, which may come from the caller rather than this store
+            code, session_id = self.generate_response(prompt, session_id, user, priority, context=context)
+            return code, code_diff(context, code), session_id
+        except QueueTimeout:
+            raise
+        except Exception as e:
+            logger.error("Edit generation failed: %s", str(e))
+            return "# Error: Unable to generate valid code", "", session_id
+
+        self._store_message(session_id, "user", prompt)
+        self._store_message(session_id, "assistant", code)
+        return code, code_diff(context, code), session_id
+
     def _sanitize_code(self, code: str) -> str:
         """Extract code while preserving indentation"""
         # Match Python code blocks with indentation
@@ -147,20 +265,16 @@ You are a Python code maintenance expert. Follow these rules:
             if line.strip() and not line.strip().startswith(('Here is', 'def test', 'def count'))
         ]).strip()
 
-    def _validate_code(self, code: str, original_context: str):
-        """Validate code preserves core functionality"""
-        # Check if main function exists in both context and new code
-        context_func = re.search(r'def\s+(\w+)\s*\(', original_context)
-        new_func = re.search(r'def\s+(\w+)\s*\(', code)
-        
-        if context_func and (not new_func or new_func.group(1) != context_func.group(1)):
-            raise ValueError("Core function changed or removed")
-            
-        # Basic syntax check
-        try:
-            compile(code, "<string>", "exec")
-        except Exception as e:
-            raise ValueError(f"Invalid Python syntax: {str(e)}")
+    def _validate_code(self, code: str, original_context: str, tests: str = None) -> dict:
+        """Validate code preserves core functionality, raising ValueError on the first error"""
+        with tracing.span("validation"):
+            report = self.validator.validate(code, original_context, tests)
+        errors = [d for d in report["diagnostics"] if d["severity"] == "error"]
+        if errors:
+            raise ValueError("; ".join(
+                f"{d['check']}: {d['message']}" + (f" (line {d['line']})" if d["line"] else "") for d in errors
+            ))
+        return report
 
 if __name__ == "__main__":
     dotenv.load_dotenv()
@@ -0,0 +1,260 @@
+# services/llm_router.py
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Optional
+from services.llm_service import LLMProvider, ProviderError, AnthropicService, GroqService, FakeProvider
+from services.llm_scheduler import QueueTimeout, default_scheduler, estimate_tokens
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_LATENCY = REGISTRY.histogram(
+    "rw_llm_provider_duration_seconds",
+    "Upstream LLM call latency by provider, model and outcome",
+    labelnames=("provider", "model", "outcome")
+)
+ROUTER_EVENTS = REGISTRY.counter(
+    "rw_llm_router_events_total",
+    "Router hedges, failovers and circuit-breaker transitions",
+    labelnames=("provider", "model", "event")
+)
+
+PROVIDER_CLASSES = {
+    "anthropic": AnthropicService,
+    "groq": GroqService,
+    "fake": FakeProvider,
+}
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets one probe through after a cooldown"""
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a request may be sent; half-open admits a single probe"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release(self):
+        """Give back a half-open probe that was admitted but never sent"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool) -> Optional[str]:
+        """Record an outcome, returning 'opened' or 'closed' on a state change"""
+        with self._lock:
+            was_open = self.opened_at is not None
+            self._probing = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return "closed" if was_open else None
+            self.failures += 1
+            if was_open or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                return "opened"
+            return None
+
+class Backend:
+    """One provider/model pair with rolling latency and error statistics"""
+
+    def __init__(self, provider: LLMProvider, model: str, window: int = 100, breaker: CircuitBreaker = None):
+        self.provider = provider
+        self.model = model
+        self.breaker = breaker or CircuitBreaker()
+        self._samples = deque(maxlen=window)  # (latency, ok)
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider.name}:{self.model}"
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self._samples.append((latency, ok))
+        PROVIDER_LATENCY.observe(latency, provider=self.provider.name, model=self.model,
+                                 outcome="ok" if ok else "error")
+        transition = self.breaker.record(ok)
+        if transition:
+            logger.warning(f"Circuit {transition} for {self.name}")
+            ROUTER_EVENTS.inc(provider=self.provider.name, model=self.model, event=f"circuit_{transition}")
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Latency percentile over successful calls in the window"""
+        with self._lock:
+            latencies = sorted(latency for latency, ok in self._samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(pct / 100 * len(latencies)))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def score(self) -> float:
+        """Lower is better: p50 latency inflated by the recent error rate"""
+        p50 = self.percentile(50)
+        if p50 is None:
+            # Untried backends get explored first; ones that have only failed go last
+            return float("inf") if self.error_rate() else 0.0
+        return p50 * (1 + 4 * self.error_rate())
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "error_rate": self.error_rate(),
+            "circuit": self.breaker.state
+        }
+
+class LLMRouter(LLMProvider):
+    """Latency-aware router over several provider/model backends.
+
+    Each request goes to the healthy backend with the best score. If it has
+    not answered after the hedge delay (`hedge_after`, or the backend's own
+    p95 when unset) the next-best backend is fired as well and the first
+    successful answer wins. Failures fail over to the remaining backends,
+    and backends that keep failing are skipped while their breaker is open.
+
+    Every backend call first takes a scheduler slot on that backend's
+    provider, so per-provider rate limits apply to whichever backend is
+    picked; a call still queued when its slot times out fails over too.
+    """
+
+    name = "router"
+    schedules_calls = True  # Callers must not take a slot of their own
+
+    def __init__(self, backends: List[Backend], hedge_after: float = None, timeout: float = 120.0,
+                 max_workers: int = 32, scheduler=None, output_token_estimate: int = None):
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        self.backends = backends
+        self.hedge_after = hedge_after
+        self.timeout = timeout
+        self.scheduler = scheduler or default_scheduler()
+        self.output_token_estimate = output_token_estimate or int(os.getenv("LLM_OUTPUT_TOKEN_ESTIMATE", "1000"))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-router")
+
+    @classmethod
+    def from_env(cls, spec: str = None) -> "LLMRouter":
+        """Build from LLM_BACKENDS, e.g. 'anthropic:claude-3-5-sonnet-20240620,groq:llama3-70b-8192'"""
+        spec = spec or os.getenv("LLM_BACKENDS", "")
+        providers, backends = {}, []
+        for entry in filter(None, (part.strip() for part in spec.split(","))):
+            provider_name, _, model = entry.partition(":")
+            if provider_name not in providers:
+                providers[provider_name] = PROVIDER_CLASSES[provider_name]()
+            backends.append(Backend(providers[provider_name], model))
+        hedge_after = os.getenv("LLM_HEDGE_AFTER")
+        return cls(
+            backends,
+            hedge_after=float(hedge_after) if hedge_after else None,
+            timeout=float(os.getenv("LLM_ROUTER_TIMEOUT", "120"))
+        )
+
+    def ranked(self, model: str = None) -> List[Backend]:
+        """Healthy backends, best first; a backend serving `model` is preferred"""
+        candidates = [b for b in self.backends if b.breaker.state != "open"]
+        candidates.sort(key=lambda b: (b.model != model, b.score()))
+        return candidates
+
+    def _call(self, backend: Backend, prompt: str, user: str, priority: str) -> str:
+        tokens = estimate_tokens(prompt) + self.output_token_estimate
+        try:
+            with self.scheduler.slot(backend.provider.name, user=user, priority=priority, tokens=tokens):
+                # Timed inside the slot: queueing is neither the backend's latency nor its failure
+                started = time.perf_counter()
+                try:
+                    response = backend.provider.generate_response(prompt, backend.model)
+                except Exception:
+                    backend.record(time.perf_counter() - started, ok=False)
+                    raise
+                backend.record(time.perf_counter() - started, ok=True)
+        except QueueTimeout:
+            backend.breaker.release()  # The call never went out
+            raise
+        return response
+
+    def generate_response(self, prompt: str, model: str = None, user: str = None,
+                          priority: str = "interactive") -> str:
+        # Calls may wait up to their queue timeout for a slot before the call itself starts
+        deadline = time.monotonic() + self.timeout + self.scheduler.timeouts.get(priority, 0.0)
+        queue = self.ranked(model)
+        in_flight = {}
+        last_error = None
+
+        def launch() -> bool:
+            while queue:
+                backend = queue.pop(0)
+                if backend.breaker.allow():
+                    # Each call runs in a copy of the caller's context so its spans join the request trace
+                    future = self._executor.submit(contextvars.copy_context().run, self._call, backend, prompt,
+                                                   user, priority)
+                    in_flight[future] = backend
+                    return True
+            return False
+
+        if not launch():
+            raise ProviderError("No healthy LLM backend available")
+
+        while in_flight:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            primary = next(iter(in_flight.values()))
+            hedge_delay = self.hedge_after if self.hedge_after is not None else primary.percentile(95)
+            can_hedge = len(in_flight) == 1 and queue and hedge_delay is not None
+            done, _ = wait(list(in_flight), timeout=min(remaining, hedge_delay) if can_hedge else remaining,
+                           return_when=FIRST_COMPLETED)
+
+            if not done:
+                if can_hedge and launch():
+                    hedged = list(in_flight.values())[-1]
+                    ROUTER_EVENTS.inc(provider=hedged.provider.name, model=hedged.model, event="hedge")
+                continue
+
+            for future in done:
+                backend = in_flight.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"LLM backend {backend.name} failed: {str(e)}")
+                    ROUTER_EVENTS.inc(provider=backend.provider.name, model=backend.model, event="failover")
+            if not in_flight:
+                launch()
+
+        if isinstance(last_error, QueueTimeout):
+            raise last_error  # Every backend was busy: surfaced as 503 so clients back off
+        raise ProviderError(f"All LLM backends failed or timed out: {last_error}")
+
+    def stats(self) -> list:
+        return [backend.stats() for backend in self.backends]
@@ -0,0 +1,248 @@
+# services/llm_scheduler.py
+import os
+import time
+import asyncio
+import logging
+import itertools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, asynccontextmanager
+from utils.metrics import REGISTRY
+from utils import tracing
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+QUEUE_WAIT = REGISTRY.histogram(
+    "rw_llm_queue_wait_seconds",
+    "Time LLM calls spent queued for a provider slot",
+    labelnames=("provider", "priority", "outcome")
+)
+
+class QueueTimeout(Exception):
+    """Raised when a queued LLM call could not be scheduled before its deadline"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for TPM budgeting"""
+    return max(1, len(text) // 4)
+
+class TokenBucket:
+    """Refills `per_minute` units evenly over a minute, holding at most one minute's worth"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 when they are now)"""
+        self._refill()
+        # Requests larger than the bucket are admitted once it is full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+class ProviderLimits:
+    """Requests-per-minute, tokens-per-minute and concurrency limits for one provider"""
+
+    def __init__(self, rpm: float = None, tpm: float = None, concurrency: int = None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = concurrency
+        self.active = 0
+
+    def wait_time(self, tokens: int) -> float:
+        if self.concurrency and self.active >= self.concurrency:
+            return None  # Wait for a release rather than a refill
+        waits = [0.0]
+        if self.requests:
+            waits.append(self.requests.wait_time(1))
+        if self.tokens:
+            waits.append(self.tokens.wait_time(tokens))
+        return max(waits)
+
+    def take(self, tokens: int):
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(tokens)
+        self.active += 1
+
+def parse_limits(spec: str) -> dict:
+    """Parse LLM_RATE_LIMITS, e.g. 'anthropic:rpm=50,tpm=40000,concurrency=8;groq:rpm=30,tpm=6000'"""
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(";"))):
+        provider, _, options = entry.partition(":")
+        values = dict(option.split("=", 1) for option in options.split(",") if "=" in option)
+        limits[provider.strip()] = ProviderLimits(
+            rpm=float(values["rpm"]) if "rpm" in values else None,
+            tpm=float(values["tpm"]) if "tpm" in values else None,
+            concurrency=int(values["concurrency"]) if "concurrency" in values else None
+        )
+    return limits
+
+class _Waiter:
+    __slots__ = ("provider", "user", "priority", "tokens", "tag", "seq")
+
+    def __init__(self, provider, user, priority, tokens, tag, seq):
+        self.provider = provider
+        self.user = user
+        self.priority = priority
+        self.tokens = tokens
+        self.tag = tag
+        self.seq = seq
+
+    def order(self) -> tuple:
+        return self.priority, self.tag, self.seq
+
+class LLMScheduler:
+    """Admission control in front of the LLM providers.
+
+    Each provider has optional RPM/TPM token buckets and a concurrency cap.
+    Calls that do not fit wait in a queue instead of failing: interactive
+    calls always go before batch ones, and within a class users are served
+    fairly (start-time fair queueing), so one user's burst cannot starve the
+    rest. A call still queued at its deadline raises QueueTimeout.
+    """
+
+    def __init__(self, limits: dict = None, timeouts: dict = None):
+        self.limits = limits if limits is not None else parse_limits(os.getenv("LLM_RATE_LIMITS", ""))
+        self.timeouts = timeouts or {
+            "interactive": float(os.getenv("LLM_QUEUE_TIMEOUT", "30")),
+            "batch": float(os.getenv("LLM_BATCH_QUEUE_TIMEOUT", "600"))
+        }
+        self._waiting = []
+        self._virtual_time = 0.0
+        self._user_finish = {}  # user -> last virtual finish tag
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._executor = None
+        REGISTRY.gauge("rw_llm_queue_depth", "LLM calls waiting for a provider slot", lambda: len(self._waiting))
+
+    def _head(self, provider: str) -> _Waiter:
+        return min((w for w in self._waiting if w.provider == provider), key=_Waiter.order)
+
+    @contextmanager
+    def slot(self, provider: str, user: str = None, priority: str = "interactive", tokens: int = 1,
+             timeout: float = None):
+        """Hold a provider slot for the duration of one upstream call"""
+        limits = self.limits.get(provider)
+        if limits is None:
+            yield
+            return
+
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        timeout = timeout if timeout is not None else self.timeouts[priority]
+        started = time.monotonic()
+        deadline = started + timeout
+
+        with self._cond:
+            tag = max(self._virtual_time, self._user_finish.get(user, 0.0))
+            self._user_finish[user] = tag + 1
+            waiter = _Waiter(provider, user, PRIORITIES[priority], tokens, tag, next(self._seq))
+            self._waiting.append(waiter)
+            try:
+                while True:
+                    wait = limits.wait_time(tokens) if self._head(provider) is waiter else None
+                    if wait == 0.0:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        QUEUE_WAIT.observe(time.monotonic() - started, provider=provider, priority=priority,
+                                           outcome="timeout")
+                        raise QueueTimeout(
+                            f"{provider} queue deadline of {timeout:g}s exceeded",
+                            retry_after=wait if wait else 1.0
+                        )
+                    self._cond.wait(min(remaining, wait) if wait else remaining)
+            finally:
+                self._waiting.remove(waiter)
+                self._cond.notify_all()
+            limits.take(tokens)
+            self._virtual_time = max(self._virtual_time, tag)
+            if len(self._user_finish) > 10000:
+                # Users at or behind virtual time are indistinguishable from new ones
+                self._user_finish = {u: f for u, f in self._user_finish.items() if f > self._virtual_time}
+
+        QUEUE_WAIT.observe(time.monotonic() - started, provider=provider, priority=priority, outcome="admitted")
+        tracing.record("queue", time.monotonic() - started, provider=provider)
+        try:
+            yield
+        finally:
+            with self._cond:
+                limits.active -= 1
+                self._cond.notify_all()
+
+    @asynccontextmanager
+    async def async_slot(self, provider: str, user: str = None, priority: str = "interactive", tokens: int = 1,
+                         timeout: float = None):
+        """`slot` for the event loop: queued calls wait on a worker thread, not the loop"""
+        if provider not in self.limits:
+            yield
+            return
+
+        manager = self.slot(provider, user=user, priority=priority, tokens=tokens, timeout=timeout)
+        acquired = asyncio.get_running_loop().run_in_executor(
+            self._queue_executor(), contextvars.copy_context().run, manager.__enter__
+        )
+        try:
+            await asyncio.shield(acquired)
+        except asyncio.CancelledError:
+            # The waiting thread cannot be interrupted; give back the slot if it still gets one
+            acquired.add_done_callback(
+                lambda future: future.cancelled() or future.exception() or manager.__exit__(None, None, None)
+            )
+            raise
+        try:
+            yield
+        finally:
+            manager.__exit__(None, None, None)
+
+    def _queue_executor(self) -> ThreadPoolExecutor:
+        # Each queued async call parks one thread, so the default loop executor would run dry
+        with self._cond:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("LLM_ASYNC_QUEUE_THREADS", "64")),
+                    thread_name_prefix="llm-queue"
+                )
+            return self._executor
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                provider: {
+                    "queued": sum(1 for w in self._waiting if w.provider == provider),
+                    "active": limits.active
+                }
+                for provider, limits in self.limits.items()
+            }
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+def default_scheduler() -> LLMScheduler:
+    """Process-wide scheduler shared by every middleware"""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = LLMScheduler()
+        return _default_scheduler
@@ -1,15 +1,29 @@
 from abc import ABC, abstractmethod
 from groq import Groq
+from langchain_anthropic import ChatAnthropic
+from langchain_core.prompts import ChatPromptTemplate
+from services.llm_middleware import SYSTEM_PROMPT
 import os
+import time
+import random
+import threading
+from utils.http_pool import shared_httpx_client
+
+class ProviderError(Exception):
+    """Raised when a provider call fails and another backend should be tried"""
 
 class LLMProvider(ABC):
+    name = "provider"
+
     @abstractmethod
     def generate_response(self, prompt: str, model: str) -> str:
         pass
 
 class GroqService(LLMProvider):
+    name = "groq"
+
     def __init__(self):
-        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"), http_client=shared_httpx_client())
     
     def generate_response(self, prompt: str, model: str = "llama3-70b-8192") -> str:
         try:
@@ -31,15 +45,64 @@ class GroqService(LLMProvider):
             )
             response = completion.choices[0].message.content.strip()
 
-            print(response)
             # Fallback: If the response is empty or not Python code, return the fallback message
             if not response or not any(keyword in response for keyword in ['def ', 'import ', 'print(', 'class ']):
                 return "# I do not understand the request please provide information to generate python code"
 
             return response
 
-        except Exception:
-            return "# I do not understand the request please provide information to generate python code"
+        except Exception as e:
+            # Surface API failures so the router can fail over
+            raise ProviderError(f"Groq call failed: {str(e)}") from e
+
+class AnthropicService(LLMProvider):
+    name = "anthropic"
+
+    def __init__(self):
+        self.prompt_template = ChatPromptTemplate.from_messages([
+            ("system", SYSTEM_PROMPT),
+            ("human", "{input}")
+        ])
+        self._chains = {}
+        self._lock = threading.Lock()
+
+    def _chain(self, model: str):
+        """One chain per model, built on first use"""
+        with self._lock:
+            if model not in self._chains:
+                self._chains[model] = self.prompt_template | ChatAnthropic(
+                    model=model,
+                    temperature=0.0,
+                    max_tokens=4000,
+                    anthropic_api_key=os.getenv("ANTHROPIC_API_KEY")
+                )
+            return self._chains[model]
+
+    def generate_response(self, prompt: str, model: str = "claude-3-5-sonnet-20240620") -> str:
+        try:
+            result = self._chain(model).invoke({"input": prompt})
+        except Exception as e:
+            raise ProviderError(f"Anthropic call failed: {str(e)}") from e
+        return result.content.strip().replace('``````', '').strip()
+
+class FakeProvider(LLMProvider):
+    """Local stand-in with configurable latency and failure rate, for tests and benchmarks"""
+
+    def __init__(self, name: str = "fake", latency: float = 0.05, jitter: float = 0.0,
+                 error_rate: float = 0.0, response: str = "def generated():\n    return None"):
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.response = response
+        self.calls = 0
+
+    def generate_response(self, prompt: str, model: str = "fake-model") -> str:
+        self.calls += 1
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if random.random() < self.error_rate:
+            raise ProviderError(f"{self.name} injected failure")
+        return self.response
 
 # Example for future OpenAI implementation
 # class OpenAIService(LLMProvider): ...
@@ -0,0 +1,182 @@
+# services/response_cache.py
+import os
+import re
+import math
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+from utils.metrics import REGISTRY
+
+CACHE_LOOKUPS = REGISTRY.counter(
+    "rw_response_cache_lookups_total",
+    "Response cache lookups by outcome (exact, semantic, miss, bypass)",
+    labelnames=("result",)
+)
+CACHE_SAVED_SECONDS = REGISTRY.counter(
+    "rw_response_cache_saved_seconds_total",
+    "Estimated provider latency avoided by cache hits"
+)
+
+EMBEDDING_DIMS = 1024
+FILLER_WORDS = {"a", "an", "the", "please", "can", "you", "me", "for"}
+
+def normalize_prompt(prompt: str) -> str:
+    """Case-fold, drop filler words, collapse whitespace and trailing punctuation"""
+    words = prompt.lower().strip().rstrip(".!?;: ").split()
+    return " ".join(word for word in words if word not in FILLER_WORDS)
+
+def embed(text: str) -> dict:
+    """Hashed bag of words and character trigrams, L2-normalised (sparse)"""
+    features = {}
+    words = re.findall(r"\w+", text)
+    grams = words + [text[i:i + 3] for i in range(max(len(text) - 2, 0))]
+    for gram in grams:
+        slot = int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=4).digest(), "little") % EMBEDDING_DIMS
+        features[slot] = features.get(slot, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in features.values())) or 1.0
+    return {slot: v / norm for slot, v in features.items()}
+
+def cosine(a: dict, b: dict) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(slot, 0.0) for slot, v in a.items())
+
+class ResponseCache:
+    """Exact and near-duplicate cache of provider responses.
+
+    Exact hits key on (normalised prompt, context digest, model). Near hits
+    are off unless `semantic` (RESPONSE_CACHE_SEMANTIC) is set: the hashed
+    embedding scores one-word meaning changes ("total" vs "average") above
+    any usable threshold, so a near hit also requires the same set of
+    non-filler words as the cached prompt (reordered or repeated wording)
+    and a score at or above `similarity_threshold`. Entries expire after
+    `ttl` seconds and the cache is LRU-bounded to `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = None, ttl: float = None, similarity_threshold: float = None,
+                 opt_out_users: set = None, semantic: bool = None):
+        self.max_entries = max_entries or int(os.getenv("RESPONSE_CACHE_SIZE", "5000"))
+        self.ttl = ttl or float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+        self.similarity_threshold = similarity_threshold or float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+        self.enabled = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+        self.semantic = semantic if semantic is not None else \
+            os.getenv("RESPONSE_CACHE_SEMANTIC", "false").lower() == "true"
+        self.opt_out_users = opt_out_users if opt_out_users is not None else {
+            user.strip() for user in os.getenv("RESPONSE_CACHE_OPTOUT_USERS", "").split(",") if user.strip()
+        }
+        self._entries = OrderedDict()  # key -> (response, embedding, bucket, words, stored_at)
+        self._postings = {}             # (bucket, word) -> keys; the vector index
+        self._provider_latency = 0.0    # EWMA of uncached provider calls
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket(context: str, model: str) -> tuple:
+        return hashlib.sha256((context or "").encode()).hexdigest(), model
+
+    @staticmethod
+    def _key(normalized: str, bucket: tuple) -> str:
+        return hashlib.sha256("\x00".join((normalized,) + bucket).encode()).hexdigest()
+
+    def bypass(self, user: str = None, use_cache: bool = True) -> bool:
+        """Whether this request must skip the cache entirely"""
+        return not (self.enabled and use_cache) or (user is not None and user in self.opt_out_users)
+
+    def _evict(self, key: str):
+        _, _, bucket, words, _ = self._entries.pop(key)
+        for word in words:
+            keys = self._postings.get((bucket, word))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[(bucket, word)]
+
+    def _candidates(self, bucket: tuple, words: set) -> set:
+        """Cached prompts in the same bucket containing every one of `words`"""
+        candidates = None
+        for word in sorted(words, key=lambda w: len(self._postings.get((bucket, w), ()))):
+            keys = self._postings.get((bucket, word), set())
+            candidates = set(keys) if candidates is None else candidates & keys
+            if not candidates:
+                break
+        return candidates or set()
+
+    def lookup(self, prompt: str, context: str, model: str, user: str = None, use_cache: bool = True) -> Optional[str]:
+        """Return a cached response for this prompt, or None"""
+        if self.bypass(user, use_cache):
+            CACHE_LOOKUPS.inc(result="bypass")
+            return None
+
+        normalized = normalize_prompt(prompt)
+        bucket = self._bucket(context, model)
+        key = self._key(normalized, bucket)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[4] <= self.ttl:
+                self._entries.move_to_end(key)
+                self._record_hit("exact")
+                return entry[0]
+
+            if not self.semantic:
+                CACHE_LOOKUPS.inc(result="miss")
+                return None
+
+            best_key, best_score = None, self.similarity_threshold
+            words = set(normalized.split())
+            vector = embed(normalized)
+            for candidate in self._candidates(bucket, words):
+                _, candidate_vector, _, candidate_words, stored_at = self._entries[candidate]
+                if now - stored_at > self.ttl:
+                    self._evict(candidate)
+                    continue
+                if candidate_words != words:
+                    continue  # A changed, added or dropped word can change the meaning
+                score = cosine(vector, candidate_vector)
+                if score >= best_score:
+                    best_key, best_score = candidate, score
+
+            if best_key is not None:
+                self._entries.move_to_end(best_key)
+                self._record_hit("semantic")
+                return self._entries[best_key][0]
+
+        CACHE_LOOKUPS.inc(result="miss")
+        return None
+
+    def _record_hit(self, kind: str):
+        CACHE_LOOKUPS.inc(result=kind)
+        CACHE_SAVED_SECONDS.inc(self._provider_latency)
+
+    def store(self, prompt: str, context: str, model: str, response: str, latency: float = None,
+              user: str = None, use_cache: bool = True):
+        """Cache a provider response; error placeholders are never cached"""
+        if latency is not None:
+            with self._lock:
+                self._provider_latency = latency if not self._provider_latency else \
+                    0.9 * self._provider_latency + 0.1 * latency
+        if self.bypass(user, use_cache) or not response or response.startswith("# Error"):
+            return
+
+        normalized = normalize_prompt(prompt)
+        bucket = self._bucket(context, model)
+        key = self._key(normalized, bucket)
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            words = set(normalized.split())
+            self._entries[key] = (response, embed(normalized), bucket, words, time.time())
+            for word in words:
+                self._postings.setdefault((bucket, word), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        """Lookup counts and hit rate since process start"""
+        counts = {kind: CACHE_LOOKUPS.value(result=kind) for kind in ("exact", "semantic", "miss", "bypass")}
+        served = counts["exact"] + counts["semantic"] + counts["miss"]
+        counts["hit_rate"] = (counts["exact"] + counts["semantic"]) / served if served else 0.0
+        counts["entries"] = len(self._entries)
+        return counts
@@ -0,0 +1,110 @@
+# services/single_flight.py
+import os
+import asyncio
+import hashlib
+import threading
+from utils.metrics import REGISTRY
+
+COALESCED_CALLS = REGISTRY.counter(
+    "rw_llm_coalesced_total",
+    "Upstream LLM calls by single-flight role (leader made the call, follower shared it)",
+    labelnames=("role",)
+)
+
+def flight_key(model: str, prompt: str, context: str) -> str:
+    """Key identical (model, prompt, context) requests to the same flight, whoever sent them.
+
+    Like ResponseCache keys this leaves out the user, so a team sending the
+    same prompt shares one call; requests that bypass the cache never join one.
+    """
+    context_digest = hashlib.sha256((context or "").encode()).hexdigest()
+    return hashlib.sha256("\x00".join((model or "", prompt, context_digest)).encode()).hexdigest()
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running wait and receive the same result or exception.
+    Nothing is kept once the call finishes, so this never serves stale data.
+    """
+
+    def __init__(self, enabled: bool = None):
+        self.enabled = enabled if enabled is not None else \
+            os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn, *args, **kwargs):
+        if not self.enabled:
+            return fn(*args, **kwargs)
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            COALESCED_CALLS.inc(role="follower")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        COALESCED_CALLS.inc(role="leader")
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight, for use within one event loop"""
+
+    def __init__(self, enabled: bool = None):
+        self.enabled = enabled if enabled is not None else \
+            os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+        self._calls = {}
+
+    async def do(self, key: str, fn, *args, **kwargs):
+        if not self.enabled:
+            return await fn(*args, **kwargs)
+
+        future = self._calls.get(key)
+        if future is not None:
+            COALESCED_CALLS.inc(role="follower")
+            # Shielded so a cancelled follower does not cancel the leader's call
+            return await asyncio.shield(future)
+
+        COALESCED_CALLS.inc(role="leader")
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved when there are no followers
+            raise
+        finally:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
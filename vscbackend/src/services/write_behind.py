@@ -0,0 +1,127 @@
+# services/write_behind.py
+import os
+import time
+import uuid
+import atexit
+import logging
+import threading
+from collections import deque
+from elasticsearch import helpers
+
+logger = logging.getLogger(__name__)
+
+class BulkWriter:
+    """Write-behind queue that indexes documents through the _bulk API.
+
+    Documents are flushed by a background thread once `batch_size` are queued
+    or `flush_interval` seconds have passed, whichever comes first. Documents
+    that failed with a 429, a 5xx or a transport error go back to the front
+    of the queue and are retried on the next flush, so nothing is dropped
+    while Elasticsearch is unavailable. Any other failure (a mapping error,
+    say) would fail forever, so it is logged and moved to `dead_letters`, as
+    are retries that no longer fit the bounded buffer; `add` blocks once the
+    buffer is full.
+    """
+
+    def __init__(self, es, batch_size: int = None, flush_interval: float = None, max_buffer: int = None):
+        self.es = es
+        self.batch_size = batch_size or int(os.getenv("ES_BULK_BATCH_SIZE", "200"))
+        self.flush_interval = flush_interval or float(os.getenv("ES_BULK_FLUSH_INTERVAL", "1.0"))
+        self.max_buffer = max_buffer or int(os.getenv("ES_BULK_MAX_BUFFER", "10000"))
+        self._queue = deque()
+        self.dead_letters = deque(maxlen=int(os.getenv("ES_BULK_DEAD_LETTERS", "1000")))
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="es-bulk-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, index: str, document: dict):
+        """Queue a document for indexing, waiting while the buffer is full"""
+        with self._cond:
+            while len(self._queue) >= self.max_buffer and not self._closed:
+                self._cond.wait()
+            # A client-side _id makes retries idempotent after partial failures
+            self._queue.append({"_index": index, "_id": uuid.uuid4().hex, "_source": document})
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    @staticmethod
+    def _retryable(info: dict) -> bool:
+        """Whether a failed bulk item is worth retrying: 429, 5xx, or no HTTP status (transport error)"""
+        item = next(iter(info.values()), {}) if isinstance(info, dict) else {}
+        status = item.get("status")
+        return not isinstance(status, int) or status == 429 or status >= 500
+
+    def _dead_letter(self, failures: list, reason: str):
+        """Keep (action, error) pairs that will not be retried, logging them once per flush"""
+        self.dead_letters.extend(failures)
+        logger.error(f"Bulk flush: dropped {len(failures)} documents ({reason}); first error: {failures[0][1]}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._queue) < self.batch_size:
+                    self._cond.wait(timeout=self.flush_interval)
+                closed = self._closed
+            flushed = self.flush()
+            if closed:
+                return
+            if not flushed:
+                time.sleep(self.flush_interval)  # Back off while Elasticsearch is failing
+
+    def flush(self) -> bool:
+        """Send everything currently queued, returning False if any document is queued for retry"""
+        with self._flush_lock:
+            with self._cond:
+                batch = list(self._queue)
+                self._queue.clear()
+                self._cond.notify_all()
+            if not batch:
+                return True
+
+            failed, rejected = [], []
+            try:
+                # Without internal retries streaming_bulk yields one result
+                # per action, in order; failures are retried by re-queueing
+                results = helpers.streaming_bulk(
+                    self.es, batch, chunk_size=self.batch_size,
+                    raise_on_error=False, raise_on_exception=False
+                )
+                for action, (ok, info) in zip(batch, results):
+                    if ok:
+                        continue
+                    if self._retryable(info):
+                        failed.append(action)
+                    else:
+                        rejected.append((action, info))
+            except Exception as e:
+                logger.error(f"Bulk flush failed: {str(e)}")
+                failed, rejected = batch, []
+
+            if rejected:
+                self._dead_letter(rejected, "rejected by Elasticsearch")
+            if failed:
+                with self._cond:
+                    room = max(0, self.max_buffer - len(self._queue))
+                    self._queue.extendleft(reversed(failed[:room]))
+                if failed[room:]:
+                    self._dead_letter([(action, "no room to retry") for action in failed[room:]], "retry buffer full")
+                logger.error(f"Bulk flush: {min(room, len(failed))} of {len(batch)} documents will be retried")
+                return False
+            return True
+
+    def close(self):
+        """Flush remaining documents and stop the background thread"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=30)
+        if self._queue and not self.flush():
+            logger.error(f"Shutting down with {len(self._queue)} chat messages not indexed")
@@ -0,0 +1,31 @@
+# utils/async_database.py
+import asyncio
+
+def execute_async(session, query, parameters=None) -> asyncio.Future:
+    """Run a Cassandra query without blocking the event loop.
+
+    Wraps the driver's ResponseFuture (completed on the driver's own I/O thread)
+    in an asyncio future that resolves to the first page of rows.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def _set_result(rows):
+        if not future.done():
+            future.set_result(rows)
+
+    def _set_exception(exc):
+        if not future.done():
+            future.set_exception(exc)
+
+    response_future = session.execute_async(query, parameters)
+    response_future.add_callbacks(
+        callback=lambda rows: loop.call_soon_threadsafe(_set_result, list(rows or [])),
+        errback=lambda exc: loop.call_soon_threadsafe(_set_exception, exc)
+    )
+    return future
+
+async def fetch_one(session, query, parameters=None):
+    """Return the first row of a query result, or None"""
+    rows = await execute_async(session, query, parameters)
+    return rows[0] if rows else None
@@ -0,0 +1,94 @@
+# utils/http_pool.py
+import os
+import threading
+import importlib.util
+import httpx
+from elasticsearch import Elasticsearch, AsyncElasticsearch
+from utils.metrics import REGISTRY
+
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+# HTTP/2 needs the optional h2 package; without it httpx stays on HTTP/1.1 keep-alive
+HTTP2 = os.getenv("HTTP2_ENABLED", "true").lower() == "true" and importlib.util.find_spec("h2") is not None
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "rw_http_pool_requests_total",
+    "Outbound provider HTTP requests through the shared pool, by host",
+    labelnames=("host",)
+)
+
+_lock = threading.Lock()
+_elasticsearch = None
+_httpx_client = None
+_in_flight = 0
+
+def elasticsearch_options() -> dict:
+    """Connection options shared by the sync and async Elasticsearch clients"""
+    return {
+        "connections_per_node": POOL_SIZE,
+        "http_compress": os.getenv("ES_HTTP_COMPRESS", "false").lower() == "true"
+    }
+
+def shared_elasticsearch() -> Elasticsearch:
+    """One process-wide Elasticsearch client, so every middleware shares its connection pool"""
+    global _elasticsearch
+    with _lock:
+        if _elasticsearch is None:
+            _elasticsearch = Elasticsearch(os.getenv("ELASTICSEARCH_URL"), **elasticsearch_options())
+            REGISTRY.gauge("rw_es_pool_connections_in_use", "Elasticsearch connections checked out",
+                           _es_connections_in_use)
+            REGISTRY.gauge("rw_es_pool_connections_max", "Elasticsearch connections allowed per node",
+                           lambda: POOL_SIZE)
+        return _elasticsearch
+
+def async_elasticsearch() -> AsyncElasticsearch:
+    """AsyncElasticsearch with the shared pool settings; owned by the caller's event loop"""
+    return AsyncElasticsearch(os.getenv("ELASTICSEARCH_URL"), **elasticsearch_options())
+
+def _es_connections_in_use() -> float:
+    """Checked-out urllib3 connections across the Elasticsearch node pool"""
+    if _elasticsearch is None:
+        return 0
+    in_use = 0
+    for node in _elasticsearch.transport.node_pool.all():
+        pool = getattr(node, "pool", None)
+        queue = getattr(pool, "pool", None)
+        if queue is not None:
+            in_use += pool.pool.maxsize - queue.qsize()
+    return in_use
+
+class _CountingTransport(httpx.HTTPTransport):
+    """HTTPTransport that tracks requests in flight for the pool gauges"""
+
+    def handle_request(self, request):
+        global _in_flight
+        with _lock:
+            _in_flight += 1
+        HTTP_REQUESTS.inc(host=request.url.host)
+        try:
+            return super().handle_request(request)
+        finally:
+            with _lock:
+                _in_flight -= 1
+
+def shared_httpx_client() -> httpx.Client:
+    """One keep-alive httpx client for the provider SDKs (HTTP/2 when h2 is installed)"""
+    global _httpx_client
+    with _lock:
+        if _httpx_client is None:
+            _httpx_client = httpx.Client(
+                transport=_CountingTransport(
+                    http2=HTTP2,
+                    limits=httpx.Limits(
+                        max_connections=POOL_SIZE,
+                        max_keepalive_connections=POOL_SIZE,
+                        keepalive_expiry=KEEPALIVE_EXPIRY
+                    )
+                ),
+                timeout=httpx.Timeout(float(os.getenv("HTTP_TIMEOUT", "120")), connect=10.0)
+            )
+            REGISTRY.gauge("rw_http_pool_in_flight", "Provider requests in flight on the shared pool",
+                           lambda: _in_flight)
+            REGISTRY.gauge("rw_http_pool_connections_max", "Provider connections allowed by the shared pool",
+                           lambda: POOL_SIZE)
+        return _httpx_client
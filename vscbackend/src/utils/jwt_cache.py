@@ -0,0 +1,96 @@
+# utils/jwt_cache.py
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Dict
+from cryptography.hazmat.primitives import serialization
+
+def load_private_key(pem: bytes):
+    """Parse an RSA private key from PEM bytes"""
+    return serialization.load_pem_private_key(pem, password=None)
+
+def load_public_key(pem: bytes):
+    """Parse an RSA public key from PEM bytes"""
+    return serialization.load_pem_public_key(pem)
+
+class KeyFileCache:
+    """Parsed key material that is reloaded only when the key file changes"""
+
+    def __init__(self, path: str, loader: Callable, check_interval: float = 1.0,
+                 on_reload: Optional[Callable] = None):
+        self.path = path
+        self.loader = loader
+        self.check_interval = check_interval
+        self.on_reload = on_reload
+        self._key = None
+        self._mtime_ns = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the parsed key, re-reading the file if its mtime moved"""
+        now = time.monotonic()
+        if self._key is not None and now - self._checked_at < self.check_interval:
+            return self._key
+
+        with self._lock:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+            if self._key is None or mtime_ns != self._mtime_ns:
+                with open(self.path, "rb") as f:
+                    key = self.loader(f.read())
+                reloaded = self._key is not None
+                self._key, self._mtime_ns = key, mtime_ns
+                if reloaded and self.on_reload:
+                    self.on_reload()
+            self._checked_at = now
+            return self._key
+
+class VerifiedTokenCache:
+    """Bounded LRU of verified JWT payloads keyed by token digest.
+
+    Entries expire after `ttl` seconds or at the token's own `exp`, whichever
+    comes first, so a cached token is never accepted past its expiry.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[Dict]:
+        """Return the cached payload for a token, or None"""
+        key = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def put(self, token: str, payload: Dict):
+        """Cache a verified payload until min(now + ttl, exp)"""
+        expires_at = time.time() + self.ttl
+        if "exp" in payload:
+            expires_at = min(expires_at, float(payload["exp"]))
+
+        key = self._digest(token)
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
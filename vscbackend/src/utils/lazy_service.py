@@ -0,0 +1,120 @@
+# utils/lazy_service.py
+import os
+import time
+import logging
+import threading
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+RETRY_MIN = float(os.getenv("WARMUP_RETRY_MIN", "1"))
+RETRY_MAX = float(os.getenv("WARMUP_RETRY_MAX", "30"))
+
+_services = []
+
+REGISTRY.gauge("rw_services_not_ready", "Lazily built services not yet constructed",
+               lambda: sum(1 for service in _services if not service.ready))
+
+class ServiceNotReady(Exception):
+    """Raised when a lazily built service failed to start and is backing off"""
+
+    def __init__(self, name: str, retry_after: float, cause: Exception = None):
+        super().__init__(f"{name} is not ready (retry in {retry_after:g}s): {cause or 'still starting'}")
+        self.name = name
+        self.retry_after = retry_after
+        self.cause = cause
+
+class LazyService:
+    """Build a service on first use instead of at import time.
+
+    Construction runs once, under a lock, in whichever thread asks first (a
+    request or the warm-up thread). If it raises, callers get ServiceNotReady
+    until an exponential backoff expires, so a briefly unavailable dependency
+    such as Elasticsearch neither crashes the worker nor gets hammered by
+    every request.
+
+    With `build_on_demand=False` only warm_up builds the service, and `get`
+    raises ServiceNotReady until it is up. That is for callers on an event
+    loop, which must neither wait on the lock nor run a blocking factory.
+    """
+
+    def __init__(self, name: str, factory, build_on_demand: bool = True):
+        self.name = name
+        self._factory = factory
+        self.build_on_demand = build_on_demand
+        self._instance = None
+        self._lock = threading.Lock()
+        self._error = None
+        self._failures = 0
+        self._retry_at = 0.0
+        _services.append(self)
+
+    @property
+    def ready(self) -> bool:
+        return self._instance is not None
+
+    def get(self):
+        instance = self._instance
+        if instance is not None:
+            return instance
+        if not self.build_on_demand:
+            raise ServiceNotReady(self.name, max(self._retry_at - time.monotonic(), RETRY_MIN), self._error)
+        return self._build()
+
+    def _build(self):
+        with self._lock:
+            if self._instance is not None:
+                return self._instance
+            now = time.monotonic()
+            if now < self._retry_at:
+                raise ServiceNotReady(self.name, self._retry_at - now, self._error)
+            started = time.perf_counter()
+            try:
+                self._instance = self._factory()
+            except Exception as e:
+                self._failures += 1
+                self._error = e
+                backoff = min(RETRY_MAX, RETRY_MIN * 2 ** (self._failures - 1))
+                self._retry_at = time.monotonic() + backoff
+                logger.error(f"{self.name} initialization failed (attempt {self._failures}): {str(e)}")
+                raise ServiceNotReady(self.name, backoff, e) from e
+            self._error = None
+            logger.info(f"{self.name} ready in {(time.perf_counter() - started) * 1000:.0f}ms")
+            return self._instance
+
+    def status(self) -> dict:
+        if self.ready:
+            return {"ready": True}
+        status = {"ready": False, "failures": self._failures}
+        if self._error is not None:
+            status["error"] = str(self._error)
+        return status
+
+    def __getattr__(self, attr):
+        # Only reached for attributes LazyService itself lacks: delegate to the service
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.get(), attr)
+
+def warm_up(*services: LazyService) -> threading.Thread:
+    """Build the services in a background thread, retrying until each is ready"""
+    def run():
+        pending = list(services)
+        while pending:
+            waits = []
+            for service in pending:
+                try:
+                    service._build()
+                except ServiceNotReady as e:
+                    waits.append(e.retry_after)  # One failing dependency must not hold up the rest
+            pending = [service for service in pending if not service.ready]
+            if pending:
+                time.sleep(max(min(waits, default=RETRY_MIN), 0.05))
+
+    thread = threading.Thread(target=run, name="service-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def readiness(*services: LazyService) -> dict:
+    """Per-service readiness, for the readiness endpoint"""
+    return {service.name: service.status() for service in services}
@@ -0,0 +1,60 @@
+# utils/migrations.py
+"""One-time Cassandra schema migrations for the backend.
+
+Run once per deployment (not per process) before starting the API:
+
+    python -m utils.migrations
+"""
+import logging
+from datetime import datetime
+from utils.database import KEYSPACE, get_cassandra_cluster
+
+logger = logging.getLogger(__name__)
+
+# (version, description, statements) - append only, never edit applied entries
+MIGRATIONS = [
+    (1, "create users table", [
+        "CREATE TABLE IF NOT EXISTS users ("
+        "email text PRIMARY KEY, "
+        "password text, "
+        "created_at timestamp)"
+    ]),
+]
+
+def apply_migrations(session) -> list:
+    """Apply pending migrations, returning the versions that were run"""
+    session.execute(
+        f"CREATE KEYSPACE IF NOT EXISTS {KEYSPACE} WITH replication = "
+        "{'class': 'SimpleStrategy', 'replication_factor': 1}"
+    )
+    session.set_keyspace(KEYSPACE)
+    session.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version int PRIMARY KEY, "
+        "description text, "
+        "applied_at timestamp)"
+    )
+
+    applied = {row.version for row in session.execute("SELECT version FROM schema_migrations")}
+    ran = []
+    for version, description, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info(f"Applying migration {version}: {description}")
+        for statement in statements:
+            session.execute(statement)
+        session.execute(
+            "INSERT INTO schema_migrations (version, description, applied_at) VALUES (%s, %s, %s)",
+            [version, description, datetime.now()]
+        )
+        ran.append(version)
+    return ran
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    cluster = get_cassandra_cluster()
+    try:
+        ran = apply_migrations(cluster.connect())
+        logger.info(f"Applied migrations: {ran}" if ran else "Schema is up to date")
+    finally:
+        cluster.shutdown()
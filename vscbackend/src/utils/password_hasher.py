@@ -0,0 +1,102 @@
+# utils/password_hasher.py
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+from utils.metrics import REGISTRY
+
+HASH_LATENCY = REGISTRY.histogram(
+    "rw_password_hash_duration_seconds",
+    "bcrypt latency including time queued for a pool worker",
+    labelnames=("operation",)
+)
+HASH_REJECTED = REGISTRY.counter(
+    "rw_password_hash_rejected_total",
+    "bcrypt requests refused because the worker pool queue was full",
+    labelnames=("operation",)
+)
+
+class HasherSaturated(Exception):
+    """Raised when the bcrypt pool has no free queue slot"""
+
+def _hash_password(password: bytes) -> str:
+    return bcrypt.hashpw(password, bcrypt.gensalt()).decode()
+
+def _check_password(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+class PasswordHasher:
+    """bcrypt on a size-limited process pool with admission control.
+
+    At most `workers` hashes run at once and at most `max_pending` more may
+    wait; anything beyond that fails fast with HasherSaturated instead of
+    tying up a request thread for the length of the queue.
+    """
+
+    def __init__(self, workers: int = None, max_pending: int = None):
+        self.workers = workers or int(os.getenv("BCRYPT_WORKERS", min(4, os.cpu_count() or 1)))
+        self.max_pending = max_pending if max_pending is not None else int(
+            os.getenv("BCRYPT_MAX_PENDING", self.workers * 8)
+        )
+        # Workers are forked eagerly so the fork happens before the Cassandra
+        # driver starts its I/O threads; build the hasher before the session
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("fork")
+        )
+        self._executor.submit(int).result()
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+        REGISTRY.gauge("rw_password_hash_in_flight", "bcrypt jobs running or queued", lambda: self.in_flight)
+        REGISTRY.gauge("rw_password_hash_capacity", "bcrypt jobs admitted before rejecting",
+                       lambda: self.workers + self.max_pending)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _submit(self, operation: str, fn, *args):
+        """Admit a job into the pool or raise HasherSaturated"""
+        if not self._slots.acquire(blocking=False):
+            HASH_REJECTED.inc(operation=operation)
+            raise HasherSaturated(f"bcrypt pool saturated ({self.workers + self.max_pending} jobs)")
+
+        started = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+
+        def _release(_):
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+            HASH_LATENCY.observe(time.perf_counter() - started, operation=operation)
+
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            _release(None)
+            raise
+        future.add_done_callback(_release)
+        return future
+
+    def hash_password(self, password: str) -> str:
+        return self._submit("hash", _hash_password, password.encode()).result()
+
+    def check_password(self, password: str, hashed: str) -> bool:
+        return self._submit("check", _check_password, password.encode(), hashed.encode()).result()
+
+    async def hash_password_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit("hash", _hash_password, password.encode()))
+
+    async def check_password_async(self, password: str, hashed: str) -> bool:
+        return await asyncio.wrap_future(
+            self._submit("check", _check_password, password.encode(), hashed.encode())
+        )
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
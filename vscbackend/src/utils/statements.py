@@ -0,0 +1,31 @@
+# utils/statements.py
+import threading
+from cassandra.query import PreparedStatement
+
+class StatementCache:
+    """Prepare each CQL string once per session and reuse the statement.
+
+    Prepared statements carry the partition-key indexes of their table, so
+    bound statements get a routing key and TokenAwarePolicy can send them
+    straight to a replica instead of a random coordinator.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._statements = {}
+        self._lock = threading.Lock()
+
+    def get(self, query: str) -> PreparedStatement:
+        """Return the prepared statement for a query, preparing it on first use"""
+        statement = self._statements.get(query)
+        if statement is None:
+            with self._lock:
+                statement = self._statements.get(query)
+                if statement is None:
+                    statement = self.session.prepare(query)
+                    self._statements[query] = statement
+        return statement
+
+    def prepare_all(self, queries: dict) -> dict:
+        """Prepare a {name: query} mapping up front, returning {name: statement}"""
+        return {name: self.get(query) for name, query in queries.items()}
@@ -0,0 +1,117 @@
+# utils/tracing.py
+import os
+import json
+import time
+import uuid
+import logging
+import contextvars
+from contextlib import contextmanager, ExitStack
+from utils.metrics import REGISTRY
+
+try:
+    from opentelemetry import trace as otel_trace  # Optional: export spans when an SDK is configured
+    _tracer = otel_trace.get_tracer("rw.backend")
+except ImportError:
+    _tracer = None
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger("rw.slow_requests")
+
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "5"))
+
+STAGE_LATENCY = REGISTRY.histogram(
+    "rw_request_stage_duration_seconds",
+    "Time spent in each stage of a request (auth, history_read, cache, queue, llm, validation, history_write)",
+    labelnames=("stage", "model", "provider")
+)
+
+_current = contextvars.ContextVar("rw_trace", default=None)
+
+class Trace:
+    """Spans recorded for one request, tagged with the model and provider that served it"""
+
+    def __init__(self, name: str, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = dict(attributes)
+        self.started = time.perf_counter()
+        self.spans = []  # (stage, offset, duration, attributes)
+
+    def tag(self, **attributes):
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def breakdown(self) -> dict:
+        """Total seconds per stage"""
+        totals = {}
+        for stage, _, duration, _ in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + duration
+        return totals
+
+def current_trace():
+    return _current.get()
+
+def tag(**attributes):
+    """Tag the current request's trace, e.g. once the model and provider are known"""
+    trace = _current.get()
+    if trace is not None:
+        trace.tag(**attributes)
+
+def start_trace(name: str, **attributes):
+    """Begin a trace for this request; returns the token finish_trace needs"""
+    return _current.set(Trace(name, **attributes))
+
+def finish_trace(token, trace: Trace = None, **attributes):
+    """Publish stage histograms and log the breakdown when the request was slow.
+
+    `trace` defaults to the current one; streamed responses pass the trace
+    they captured, since they finish after the request hooks have run.
+    """
+    trace = trace or _current.get()
+    try:
+        _current.reset(token)
+    except ValueError:
+        pass  # Finished from another context; the trace is still published
+    if trace is None:
+        return None
+    trace.tag(**attributes)
+    model = str(trace.attributes.get("model", "none"))
+    provider = str(trace.attributes.get("provider", "none"))
+    for stage, _, duration, _ in trace.spans:
+        STAGE_LATENCY.observe(duration, stage=stage, model=model, provider=provider)
+
+    total = time.perf_counter() - trace.started
+    if total >= SLOW_REQUEST_SECONDS:
+        slow_logger.warning(json.dumps({
+            "trace_id": trace.trace_id,
+            "name": trace.name,
+            "total_ms": round(total * 1000, 1),
+            "attributes": trace.attributes,
+            "stages_ms": {stage: round(d * 1000, 1) for stage, d in trace.breakdown().items()},
+            "spans": [
+                {"stage": stage, "offset_ms": round(offset * 1000, 1), "duration_ms": round(d * 1000, 1), **attrs}
+                for stage, offset, d, attrs in trace.spans
+            ]
+        }, default=str))
+    return trace
+
+def record(stage: str, duration: float, **attributes):
+    """Record a stage timed elsewhere; outside a trace it goes straight to the histogram"""
+    trace = _current.get()
+    if trace is not None:
+        offset = time.perf_counter() - duration - trace.started
+        trace.spans.append((stage, offset, duration, attributes))
+    else:
+        STAGE_LATENCY.observe(duration, stage=stage, model=str(attributes.get("model", "none")),
+                              provider=str(attributes.get("provider", "none")))
+
+@contextmanager
+def span(stage: str, **attributes):
+    """Time one stage of the current request"""
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            if _tracer is not None:
+                stack.enter_context(_tracer.start_as_current_span(f"rw.{stage}", attributes=attributes))
+            yield
+    finally:
+        record(stage, time.perf_counter() - started, **attributes)